@@ -0,0 +1,288 @@
+"""
+Inventory analytics for the admin dashboard.
+
+Per-brand aggregates live in the brand_inventory table and are updated
+incrementally by the watch CRUD operations, so reports are served in time
+proportional to the number of brands rather than the size of the catalog.
+
+low_stock_count depends on LOW_STOCK_THRESHOLD, so the threshold used is
+stored with the aggregates and startup rebuilds them when it changes.
+
+A full rebuild and a consistency check are available for recovery:
+    python analytics.py rebuild
+    python analytics.py check
+"""
+
+import argparse
+import math
+import os
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from models import BrandInventory, InventoryState, Watch
+
+# Watches with stock at or below this count are reported as low stock
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "2"))
+
+
+def watch_snapshot(watch: Watch):
+    """
+    Capture the fields of a watch that feed the inventory aggregates.
+
+    Args:
+        watch: Watch object
+
+    Returns:
+        tuple: (brand, price, stock)
+    """
+    return (watch.brand, watch.price, watch.stock)
+
+
+def apply_watch_change(db: Session, before, after):
+    """
+    Update brand aggregates for a single watch write.
+
+    Must be called after the watch change has been flushed and before the
+    transaction commits, so aggregates commit atomically with the watch.
+
+    Args:
+        db: Database session
+        before: Snapshot of the watch before the write, or None on create
+        after: Snapshot of the watch after the write, or None on delete
+    """
+    if before == after:
+        return
+    touched = []
+    if before is not None:
+        touched.append(_remove(db, *before))
+    if after is not None:
+        touched.append(_add(db, *after))
+
+    # Drop brands left empty only after both steps, so moving a brand's
+    # last watch to another price or stock reuses the same row
+    for row in touched:
+        if row is not None and row.watch_count <= 0:
+            db.delete(row)
+
+
+def _add(db: Session, brand: str, price: float, stock: int):
+    """Add one watch to its brand's aggregates and return the row."""
+    row = db.get(BrandInventory, brand)
+    if row is None:
+        row = BrandInventory(
+            brand=brand,
+            watch_count=0,
+            stock_units=0,
+            stock_value=0.0,
+            price_sum=0.0,
+            min_price=price,
+            max_price=price,
+            low_stock_count=0,
+        )
+        db.add(row)
+    elif row.watch_count <= 0:
+        row.min_price = row.max_price = price
+
+    row.watch_count += 1
+    row.stock_units += stock
+    row.stock_value += price * stock
+    row.price_sum += price
+    row.min_price = min(row.min_price, price)
+    row.max_price = max(row.max_price, price)
+    if stock <= LOW_STOCK_THRESHOLD:
+        row.low_stock_count += 1
+    return row
+
+
+def _remove(db: Session, brand: str, price: float, stock: int):
+    """Remove one watch from its brand's aggregates and return the row."""
+    row = db.get(BrandInventory, brand)
+    if row is None:
+        return None
+
+    row.watch_count -= 1
+    row.stock_units -= stock
+    row.stock_value -= price * stock
+    row.price_sum -= price
+    if stock <= LOW_STOCK_THRESHOLD:
+        row.low_stock_count -= 1
+
+    # Min/max cannot be reversed incrementally; rescan only this brand
+    # (indexed) when the removed watch held one of the bounds
+    if row.watch_count > 0 and (price <= row.min_price or price >= row.max_price):
+        row.min_price, row.max_price = (
+            db.query(func.min(Watch.price), func.max(Watch.price))
+            .filter(Watch.brand == brand)
+            .one()
+        )
+    return row
+
+
+def compute_brand_stats(db: Session):
+    """
+    Compute brand aggregates from scratch with a full scan of watches.
+
+    Args:
+        db: Database session
+
+    Returns:
+        dict: Brand name mapped to a dict of BrandInventory column values
+    """
+    rows = (
+        db.query(
+            Watch.brand,
+            func.count(Watch.id),
+            func.sum(Watch.stock),
+            func.sum(Watch.price * Watch.stock),
+            func.sum(Watch.price),
+            func.min(Watch.price),
+            func.max(Watch.price),
+            func.sum(case((Watch.stock <= LOW_STOCK_THRESHOLD, 1), else_=0)),
+        )
+        .group_by(Watch.brand)
+        .all()
+    )
+    return {
+        brand: {
+            "watch_count": count,
+            "stock_units": stock_units,
+            "stock_value": stock_value,
+            "price_sum": price_sum,
+            "min_price": min_price,
+            "max_price": max_price,
+            "low_stock_count": low_stock_count,
+        }
+        for brand, count, stock_units, stock_value, price_sum, min_price, max_price, low_stock_count in rows
+    }
+
+
+def rebuild_inventory(db: Session):
+    """
+    Replace all brand aggregates with freshly computed values.
+
+    Args:
+        db: Database session
+
+    Returns:
+        int: Number of brands rebuilt
+    """
+    stats = compute_brand_stats(db)
+    db.query(BrandInventory).delete(synchronize_session=False)
+    for brand, values in stats.items():
+        db.add(BrandInventory(brand=brand, **values))
+    state = db.get(InventoryState, 1) or InventoryState(id=1)
+    state.low_stock_threshold = LOW_STOCK_THRESHOLD
+    db.add(state)
+    db.commit()
+    return len(stats)
+
+
+def inventory_is_stale(db: Session) -> bool:
+    """
+    Check whether the aggregates need a rebuild before they can be served.
+
+    Args:
+        db: Database session
+
+    Returns:
+        bool: True if they were never rebuilt with a recorded threshold
+        (e.g. the catalog predates them) or used a different threshold
+    """
+    state = db.get(InventoryState, 1)
+    return state is None or state.low_stock_threshold != LOW_STOCK_THRESHOLD
+
+
+def check_inventory(db: Session):
+    """
+    Compare the maintained aggregates against a full recomputation.
+
+    Float sums are compared with a one-cent tolerance to allow for
+    rounding drift from incremental updates.
+
+    Args:
+        db: Database session
+
+    Returns:
+        List[str]: Human-readable mismatches, empty if consistent
+    """
+    expected = compute_brand_stats(db)
+    actual = {row.brand: row for row in db.query(BrandInventory).all()}
+    mismatches = []
+
+    state = db.get(InventoryState, 1)
+    if state is not None and state.low_stock_threshold != LOW_STOCK_THRESHOLD:
+        mismatches.append(
+            f"low stock counted at threshold {state.low_stock_threshold}, "
+            f"current threshold is {LOW_STOCK_THRESHOLD}"
+        )
+
+    for brand in sorted(expected.keys() | actual.keys()):
+        if brand not in actual:
+            mismatches.append(f"{brand}: missing aggregate row")
+            continue
+        if brand not in expected:
+            mismatches.append(f"{brand}: aggregate row for brand with no watches")
+            continue
+        for field, value in expected[brand].items():
+            stored = getattr(actual[brand], field)
+            if not math.isclose(stored, value, abs_tol=0.01):
+                mismatches.append(f"{brand}: {field} is {stored}, expected {value}")
+
+    return mismatches
+
+
+def get_inventory_summary(db: Session):
+    """
+    Build the inventory report from the maintained aggregates.
+
+    Args:
+        db: Database session
+
+    Returns:
+        dict: Per-brand stats ordered by stock value, plus catalog totals
+    """
+    rows = db.query(BrandInventory).order_by(BrandInventory.stock_value.desc()).all()
+    brands = [
+        {
+            "brand": row.brand,
+            "watch_count": row.watch_count,
+            "stock_units": row.stock_units,
+            "stock_value": row.stock_value,
+            "min_price": row.min_price,
+            "max_price": row.max_price,
+            "avg_price": row.price_sum / row.watch_count,
+            "low_stock_count": row.low_stock_count,
+        }
+        for row in rows
+    ]
+    return {
+        "brands": brands,
+        "watch_count": sum(b["watch_count"] for b in brands),
+        "stock_units": sum(b["stock_units"] for b in brands),
+        "stock_value": sum(b["stock_value"] for b in brands),
+        "low_stock_count": sum(b["low_stock_count"] for b in brands),
+        "low_stock_threshold": LOW_STOCK_THRESHOLD,
+    }
+
+
+if __name__ == "__main__":
+    from database import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Maintain inventory analytics aggregates.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"✅ Rebuilt inventory aggregates for {rebuild_inventory(db)} brands")
+        else:
+            problems = check_inventory(db)
+            for problem in problems:
+                print(f"❌ {problem}")
+            if not problems:
+                print("✅ Inventory aggregates are consistent")
+            raise SystemExit(1 if problems else 0)
+    finally:
+        db.close()
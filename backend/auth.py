@@ -5,7 +5,9 @@ Handles password hashing, JWT token creation/validation,
 and user authentication dependencies.
 """
 
+import hashlib
 import os
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -32,6 +34,10 @@ if not SECRET_KEY:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# A just-rotated refresh token still works this long, so two tabs refreshing
+# at once are not mistaken for token theft
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_TOKEN_REUSE_GRACE_SECONDS", "30"))
 
 # Password hashing context using bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -90,6 +96,57 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def generate_refresh_token() -> str:
+    """
+    Generate a new opaque refresh token.
+    
+    Returns:
+        str: URL-safe random token (returned to the client once, never stored)
+    """
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    Hash a refresh token for storage and lookup.
+    
+    Refresh tokens are high-entropy random strings, so a fast SHA-256
+    digest is sufficient - no bcrypt work is needed on refresh.
+    
+    Args:
+        token: Plain refresh token
+        
+    Returns:
+        str: SHA-256 hex digest
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_user_from_token(token: str, db: Session) -> Optional[User]:
+    """
+    Resolve the user a JWT access token was issued to.
+    
+    Args:
+        token: Encoded JWT token
+        db: Database session
+        
+    Returns:
+        User: The token's user, or None if the token is invalid or the user is gone
+    """
+    try:
+        # Decode JWT token
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            return None
+        token_data = TokenData(username=username)
+    except JWTError:
+        return None
+    
+    # Get user from database
+    return db.query(User).filter(User.username == token_data.username).first()
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
@@ -109,26 +166,13 @@ def get_current_user(
     Raises:
         HTTPException: If token is invalid or user not found
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        # Decode JWT token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    # Get user from database
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = get_user_from_token(token, db)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     return user
 
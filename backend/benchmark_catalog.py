@@ -0,0 +1,120 @@
+"""
+Benchmark catalog range and top-N queries: SQLite vs the in-memory snapshot.
+
+Builds throwaway SQLite catalogs of the given sizes, then times the same
+queries through crud.watch_query (IDs only) and CatalogSnapshot.query,
+checks that both return the same IDs, and reports snapshot memory use.
+
+Usage:
+    python benchmark_catalog.py [--rows 100000 1000000] [--repeat 50]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import crud
+from catalog_snapshot import CatalogSnapshot
+from database import Base
+from models import Watch
+
+BRANDS = ["Rolex", "Patek Philippe", "Omega", "Audemars Piguet", "Cartier",
+          "Jaeger-LeCoultre", "IWC", "Breitling", "Tudor", "Vacheron Constantin"]
+
+QUERIES = {
+    "in stock, < $10k, cheapest": dict(max_price=10000, in_stock=True, sort="price_asc", limit=20),
+    "top 20 Patek by price": dict(brand="Patek Philippe", sort="price_desc", limit=20),
+    "$20k-$30k, in stock": dict(min_price=20000, max_price=30000, in_stock=True, sort="price_asc", limit=100),
+    "cheapest page 50": dict(sort="price_asc", skip=1000, limit=20),
+    "< $10k, in stock, by ID": dict(max_price=10000, in_stock=True, limit=20),
+}
+
+
+def seed(session_factory, rows: int):
+    """Insert `rows` random watches in batches."""
+    rng = random.Random(42)
+    db = session_factory()
+    batch = []
+    for i in range(rows):
+        batch.append({
+            "name": f"Watch {i}",
+            "brand": rng.choice(BRANDS),
+            "description": "Benchmark watch",
+            "price": round(rng.lognormvariate(9.5, 1.0), 2),
+            "image_url": "https://example.com/watch.jpg",
+            "stock": rng.choice([0, 0, 1, 2, 3, 5]),
+        })
+        if len(batch) == 10000:
+            db.execute(insert(Watch), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Watch), batch)
+    db.commit()
+    db.close()
+
+
+def sql_ids(db, skip=0, limit=100, **filters):
+    """Run a query through the SQL path, fetching IDs only."""
+    query = crud.watch_query(db, **filters).with_entities(Watch.id)
+    return [row[0] for row in query.offset(skip).limit(limit).all()]
+
+
+def snapshot_ids(snapshot, sort=None, skip=0, limit=100, **filters):
+    """Run a query through the snapshot."""
+    return snapshot.query(sort=sort, skip=skip, limit=limit, **filters)
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn in microseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1e6
+
+
+def run(rows: int, repeat: int):
+    """Seed a catalog of `rows` watches and compare both paths."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        start = time.perf_counter()
+        seed(session_factory, rows)
+        print(f"\n{rows:,} rows (seeded in {time.perf_counter() - start:.1f}s)")
+
+        db = session_factory()
+        snapshot = CatalogSnapshot()
+        start = time.perf_counter()
+        snapshot.build(db)
+        usage = snapshot.memory_usage()
+        print(f"snapshot build {time.perf_counter() - start:.2f}s, "
+              f"arrays {sum(usage['array_bytes'].values()) / 2**20:.1f} MiB, "
+              f"total {usage['total_bytes'] / 2**20:.1f} MiB")
+
+        for label, params in QUERIES.items():
+            assert sql_ids(db, **params) == snapshot_ids(snapshot, **params), label
+            sql_us = timed(lambda: sql_ids(db, **params), repeat)
+            snap_us = timed(lambda: snapshot_ids(snapshot, **params), repeat)
+            print(f"  {label:<28} sql {sql_us:10.1f}us  snapshot {snap_us:8.1f}us  "
+                  f"x{sql_us / snap_us:,.0f}")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        run(rows, args.repeat)
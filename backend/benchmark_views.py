@@ -0,0 +1,102 @@
+"""
+Benchmark GET /watches/{watch_id} latency with and without view counting.
+
+Calls the route handler directly from several threads, once with the
+write-behind view counter disabled and once enabled, and prints latency
+percentiles for both. Runs against a throwaway SQLite file seeded with
+one watch, so the fake views never reach the real catalog.
+
+Usage:
+    python benchmark_views.py [--requests 20000] [--threads 8]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+import crud
+import database
+import schemas
+from popularity import view_counter
+
+
+def run(main, watch_id: int, requests: int, threads: int):
+    """Time `requests` calls to the handler spread over `threads` threads."""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker():
+        db = database.SessionLocal()
+        local = []
+        try:
+            for _ in range(per_thread):
+                start = time.perf_counter()
+                main.get_watch(watch_id, db)
+                local.append(time.perf_counter() - start)
+        finally:
+            db.close()
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies
+
+
+def report(label: str, latencies):
+    """Print latency percentiles in microseconds."""
+    latencies = sorted(latencies)
+    pct = lambda p: latencies[int(p * (len(latencies) - 1))] * 1e6
+    print(
+        f"{label:<18} n={len(latencies):<7} mean={statistics.mean(latencies) * 1e6:8.1f}us "
+        f"p50={pct(0.50):8.1f}us p99={pct(0.99):8.1f}us"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Rebind before importing main, whose import creates tables on the engine
+        database.engine = create_engine(
+            f"sqlite:///{os.path.join(tmp, 'bench.db')}", connect_args={"check_same_thread": False}
+        )
+        database.SessionLocal.configure(bind=database.engine)
+        import main
+
+        db = database.SessionLocal()
+        watch_id = crud.create_watch(db, schemas.WatchCreate(
+            name="Benchmark Watch",
+            brand="Benchmark",
+            description="Watch used to benchmark view counting.",
+            price=1000.0,
+            image_url="https://example.com/watch.jpg",
+            stock=1,
+        )).id
+        db.close()
+
+        # Warm up connections and caches before timing
+        run(main, watch_id, 1000, args.threads)
+
+        view_counter.enabled = False
+        report("counting disabled", run(main, watch_id, args.requests, args.threads))
+
+        view_counter.enabled = True
+        report("counting enabled", run(main, watch_id, args.requests, args.threads))
+
+        flush_start = time.perf_counter()
+        written = main.flush_view_counts()
+        print(f"flush of {written} counter rows took {(time.perf_counter() - flush_start) * 1e3:.2f}ms")
+        database.engine.dispose()
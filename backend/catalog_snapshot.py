@@ -0,0 +1,321 @@
+"""
+Array-backed in-memory snapshot of the catalog's numeric columns.
+
+Holds id, brand code, price and stock for every watch in NumPy arrays,
+plus an index of row positions sorted by (price, id). Price range
+filters become two binary searches, and top-N queries walk the sorted
+index in growing chunks until enough rows match the stock and brand
+filters. Unsorted queries walk the rows in ID order the same way, to
+match the SQL path's default order. No SQL runs for these queries. The
+caller then loads only the matching rows by primary key.
+
+The snapshot is rebuilt in full on startup and swapped in atomically.
+crud patches it after each committed write. Like the similarity index,
+it is per process and only sees writes made by the same worker.
+Set CATALOG_SNAPSHOT_ENABLED=0 to serve every query from SQLite instead.
+"""
+
+import os
+import sys
+import threading
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import Watch
+
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT_ENABLED", "1") == "1"
+
+# First and largest chunk of the price index scanned per step of a query
+_MIN_CHUNK = 256
+_MAX_CHUNK = 65536
+
+
+class CatalogSnapshot:
+    """
+    Columnar read model of watches for price range and top-N queries.
+
+    Row positions are append-only between rebuilds. A deleted watch just
+    leaves the price index, and its slot is reclaimed on the next rebuild.
+    Slots are loaded in ID order, and new IDs are normally larger than all
+    existing ones, so an ID's slot is found by binary search over the ids
+    column rather than a per-row dictionary. IDs that arrive out of order
+    are tracked in a small overflow dictionary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = False
+        self._install(
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.float64),
+            np.zeros(0, dtype=np.int32),
+            {},
+        )
+
+    def build(self, db: Session):
+        """
+        Load the numeric columns of every watch and swap in a new snapshot.
+
+        Args:
+            db: Database session
+        """
+        rows = db.query(Watch.id, Watch.brand, Watch.price, Watch.stock).order_by(Watch.id).all()
+        n = len(rows)
+        brand_codes = {}
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        brands = np.fromiter(
+            (brand_codes.setdefault(r[1], len(brand_codes)) for r in rows), dtype=np.int32, count=n
+        )
+        prices = np.fromiter((r[2] for r in rows), dtype=np.float64, count=n)
+        stock = np.fromiter((r[3] for r in rows), dtype=np.int32, count=n)
+
+        with self._lock:
+            self._install(ids, brands, prices, stock, brand_codes)
+            self.built = True
+
+    def upsert(self, watch: Watch):
+        """
+        Add or patch one watch after a committed write.
+
+        Args:
+            watch: Watch object as just committed
+        """
+        if not self.built:
+            return
+        with self._lock:
+            code = self._brand_code(watch.brand)
+            pos = self._position(watch.id)
+            if pos is None:
+                pos = self._append(watch.id)
+            if not self._live[pos]:
+                self._live[pos] = True
+                self._rows += 1
+                self._prices[pos] = watch.price
+                self._index_insert(pos)
+            elif self._prices[pos] != watch.price:
+                self._index_remove(pos)
+                self._prices[pos] = watch.price
+                self._index_insert(pos)
+            self._brands[pos] = code
+            self._stock[pos] = watch.stock
+
+    def remove(self, watch_id: int):
+        """
+        Drop one watch after a committed delete.
+
+        Args:
+            watch_id: ID of the deleted watch
+        """
+        with self._lock:
+            pos = self._position(watch_id)
+            if pos is not None and self._live[pos]:
+                self._live[pos] = False
+                self._rows -= 1
+                self._index_remove(pos)
+
+    def query(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        brand: Optional[str] = None,
+        in_stock: bool = False,
+        sort: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[int]:
+        """
+        Find watch IDs by price range, brand and stock.
+
+        Args:
+            min_price: Inclusive lower price bound
+            max_price: Inclusive upper price bound
+            brand: Exact brand name
+            in_stock: Only watches with stock > 0
+            sort: "price_asc" or "price_desc" (default: by ID), as in
+                crud.watch_query
+            skip: Number of matches to skip
+            limit: Maximum number of IDs to return
+
+        Returns:
+            List[int]: Matching watch IDs in the requested order; price
+            ties are ordered by ID, descending for "price_desc"
+        """
+        want = skip + limit
+        if limit <= 0:
+            return []
+        with self._lock:
+            code = None
+            if brand is not None:
+                code = self._brand_codes.get(brand)
+                if code is None:
+                    return []
+            if sort not in ("price_asc", "price_desc"):
+                return self._query_by_id(min_price, max_price, code, in_stock, skip, want)
+
+            descending = sort == "price_desc"
+            sorted_prices = self._sorted_prices
+            lo = 0 if min_price is None else int(np.searchsorted(sorted_prices, min_price, "left"))
+            hi = len(sorted_prices) if max_price is None else int(np.searchsorted(sorted_prices, max_price, "right"))
+
+            matches = []
+            found = 0
+            chunk = _MIN_CHUNK
+            start, end = lo, hi
+            while start < end and found < want:
+                if descending:
+                    positions = self._order[max(start, end - chunk):end][::-1]
+                    end -= len(positions)
+                else:
+                    positions = self._order[start:min(end, start + chunk)]
+                    start += len(positions)
+                if in_stock:
+                    positions = positions[self._stock[positions] > 0]
+                if code is not None:
+                    positions = positions[self._brands[positions] == code]
+                matches.append(positions)
+                found += len(positions)
+                chunk = min(chunk * 2, _MAX_CHUNK)
+
+            if not matches:
+                return []
+            return self._ids[np.concatenate(matches)[skip:want]].tolist()
+
+    def _query_by_id(self, min_price, max_price, code, in_stock, skip, want) -> List[int]:
+        """
+        Matching IDs in ID order (caller holds the lock).
+
+        Walks the ID-sorted slots in growing chunks until `want` rows
+        match, then merges in the matching overflow slots.
+        """
+        def matching(positions):
+            keep = self._live[positions]
+            if min_price is not None:
+                keep &= self._prices[positions] >= min_price
+            if max_price is not None:
+                keep &= self._prices[positions] <= max_price
+            if in_stock:
+                keep &= self._stock[positions] > 0
+            if code is not None:
+                keep &= self._brands[positions] == code
+            return positions[keep]
+
+        matches = []
+        found = 0
+        start = 0
+        chunk = _MIN_CHUNK
+        while start < self._sorted_upto and found < want:
+            end = min(self._sorted_upto, start + chunk)
+            positions = matching(np.arange(start, end))
+            matches.append(positions)
+            found += len(positions)
+            start = end
+            chunk = min(chunk * 2, _MAX_CHUNK)
+
+        # Overflow IDs beyond the scanned range sort after `want` matches
+        # and are cut by the final slice
+        if self._overflow:
+            matches.append(matching(np.fromiter(self._overflow.values(), dtype=np.int64)))
+        if not matches:
+            return []
+        ids = self._ids[np.concatenate(matches)]
+        ids.sort()
+        return ids[skip:want].tolist()
+
+    def memory_usage(self) -> dict:
+        """
+        Report snapshot size.
+
+        Returns:
+            dict: Row, slot and brand counts, bytes per array, and total bytes
+        """
+        with self._lock:
+            arrays = {
+                "ids": self._ids.nbytes,
+                "brand_codes": self._brands.nbytes,
+                "prices": self._prices.nbytes,
+                "stock": self._stock.nbytes,
+                "live": self._live.nbytes,
+                "price_index": self._order.nbytes + self._sorted_prices.nbytes,
+            }
+            # Overflow entries hold boxed ints; count the table plus key/value objects
+            lookup = sys.getsizeof(self._overflow) + len(self._overflow) * 2 * sys.getsizeof(2 ** 40)
+            return {
+                "rows": self._rows,
+                "slots": self._size,
+                "brands": len(self._brand_codes),
+                "array_bytes": arrays,
+                "lookup_bytes": lookup,
+                "total_bytes": sum(arrays.values()) + lookup,
+            }
+
+    def _install(self, ids, brands, prices, stock, brand_codes):
+        """Replace all state with freshly loaded columns (caller holds the lock)."""
+        order = np.lexsort((ids, prices))
+        self._ids = ids
+        self._brands = brands
+        self._prices = prices
+        self._stock = stock
+        self._live = np.ones(len(ids), dtype=bool)
+        self._size = self._sorted_upto = self._rows = len(ids)
+        self._overflow = {}
+        self._brand_codes = brand_codes
+        self._order = order.astype(np.int64)
+        self._sorted_prices = prices[order]
+
+    def _brand_code(self, brand: str) -> int:
+        """Return the code of a brand, assigning a new one if needed."""
+        return self._brand_codes.setdefault(brand, len(self._brand_codes))
+
+    def _position(self, watch_id: int) -> Optional[int]:
+        """Slot of a watch ID (live or deleted), or None if never loaded."""
+        pos = int(np.searchsorted(self._ids[:self._sorted_upto], watch_id))
+        if pos < self._sorted_upto and self._ids[pos] == watch_id:
+            return pos
+        return self._overflow.get(watch_id)
+
+    def _append(self, watch_id: int) -> int:
+        """Claim a new, not yet live row slot, doubling capacity when full."""
+        if self._size == len(self._ids):
+            capacity = max(16, 2 * len(self._ids))
+            for name in ("_ids", "_brands", "_prices", "_stock", "_live"):
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                setattr(self, name, grown)
+        pos = self._size
+        self._size += 1
+        self._ids[pos] = watch_id
+        if self._sorted_upto == pos and (pos == 0 or self._ids[pos - 1] < watch_id):
+            self._sorted_upto += 1
+        else:
+            self._overflow[watch_id] = pos
+        return pos
+
+    def _price_block(self, price: float):
+        """Bounds of the index entries sharing a price, sorted by ID."""
+        return (
+            int(np.searchsorted(self._sorted_prices, price, "left")),
+            int(np.searchsorted(self._sorted_prices, price, "right")),
+        )
+
+    def _index_insert(self, pos: int):
+        """Insert a row into the price index, keeping (price, id) order."""
+        price = self._prices[pos]
+        lo, hi = self._price_block(price)
+        at = lo + int(np.searchsorted(self._ids[self._order[lo:hi]], self._ids[pos]))
+        self._order = np.insert(self._order, at, pos)
+        self._sorted_prices = np.insert(self._sorted_prices, at, price)
+
+    def _index_remove(self, pos: int):
+        """Remove a row from the price index."""
+        lo, hi = self._price_block(self._prices[pos])
+        at = lo + int(np.flatnonzero(self._order[lo:hi] == pos)[0])
+        self._order = np.delete(self._order, at)
+        self._sorted_prices = np.delete(self._sorted_prices, at)
+
+
+# Process-wide snapshot used by crud and the API
+catalog_snapshot = CatalogSnapshot()
@@ -1,14 +1,30 @@
 """
 CRUD (Create, Read, Update, Delete) operations.
 
-These functions handle all database operations for users and watches.
+These functions handle all database operations for users, refresh tokens and watches.
 They are separated from route handlers for better organization and reusability.
 """
 
+import uuid
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from models import User, Watch
+from sqlalchemy import func
+from models import RefreshToken, User, Watch, WatchPopularity
 from schemas import UserCreate, WatchCreate, WatchUpdate
-from auth import get_password_hash
+from analytics import apply_watch_change, watch_snapshot
+from catalog_snapshot import catalog_snapshot
+from popularity import view_counter
+from similarity import similarity_index
+from auth import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS,
+    generate_refresh_token,
+    get_password_hash,
+    hash_refresh_token,
+)
+
+# IDs per IN (...) query; SQLite before 3.32 allows only 999 bound parameters
+ID_CHUNK_SIZE = 900
 
 
 def get_user_by_username(db: Session, username: str):
@@ -68,7 +84,207 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
-def get_watches(db: Session, skip: int = 0, limit: int = 100):
+def create_refresh_token(
+    db: Session, user_id: int, family_id: str = None, expires_at: datetime = None
+):
+    """
+    Issue a new refresh token for a user.
+    
+    Args:
+        db: Database session
+        user_id: Owner of the token
+        family_id: Family to rotate within; a new family is started if omitted
+        expires_at: Expiry carried forward from the family; a new family
+            expires REFRESH_TOKEN_EXPIRE_DAYS from now
+        
+    Returns:
+        str: The plain refresh token (only its hash is stored)
+    """
+    now = datetime.utcnow()
+    token = generate_refresh_token()
+    db_token = RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=expires_at or now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        created_at=now,
+    )
+    db.add(db_token)
+    db.commit()
+    return token
+
+
+def rotate_refresh_token(db: Session, token: str):
+    """
+    Exchange a refresh token for a new one in the same family.
+    
+    The presented token is revoked. If it was already revoked, it has been
+    used before - a sign it was stolen - so the whole family is revoked.
+    The exception is a token whose successor was issued within
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS: two tabs refreshed at the same
+    time, so the late one gets its own token in the family too. The new
+    token keeps the family's expiry, so a family cannot be kept alive
+    past REFRESH_TOKEN_EXPIRE_DAYS after login by refreshing.
+    
+    Args:
+        db: Database session
+        token: Plain refresh token presented by the client
+        
+    Returns:
+        tuple: (User, new plain refresh token), or None if the token is
+        unknown, expired, reused, or its user no longer exists
+    """
+    db_token = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.token_hash == hash_refresh_token(token))
+        .first()
+    )
+    if not db_token:
+        return None
+    if db_token.expires_at <= datetime.utcnow():
+        return None
+    
+    user = db.query(User).filter(User.id == db_token.user_id).first()
+    if not user:
+        return None
+    
+    # Claim the token atomically so two concurrent refreshes cannot both win
+    claimed = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.id == db_token.id, RefreshToken.revoked.is_(False))
+        .update({RefreshToken.revoked: True}, synchronize_session=False)
+    )
+    if not claimed and not _rotated_just_now(db, db_token):
+        revoke_refresh_token_family(db, db_token.family_id)
+        return None
+    
+    new_token = create_refresh_token(
+        db, user.id, family_id=db_token.family_id, expires_at=db_token.expires_at
+    )
+    return user, new_token
+
+
+def _rotated_just_now(db: Session, db_token: RefreshToken) -> bool:
+    """
+    Check whether a revoked token was rotated within the reuse grace window.
+    
+    Its successor is the next token issued in the family. It must still be
+    live (not rotated again, and the family not revoked) and recent.
+    
+    Args:
+        db: Database session
+        db_token: Revoked token that was presented again
+        
+    Returns:
+        bool: True if the reuse looks like a concurrent refresh
+    """
+    successor = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.family_id == db_token.family_id, RefreshToken.id > db_token.id)
+        .order_by(RefreshToken.id)
+        .first()
+    )
+    grace_start = datetime.utcnow() - timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE_SECONDS)
+    return bool(successor and not successor.revoked and successor.created_at >= grace_start)
+
+
+def revoke_refresh_token_family(db: Session, family_id: str):
+    """
+    Revoke every refresh token in a family.
+    
+    Args:
+        db: Database session
+        family_id: Family to revoke
+        
+    Returns:
+        int: Number of tokens revoked
+    """
+    count = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.family_id == family_id, RefreshToken.revoked.is_(False))
+        .update({RefreshToken.revoked: True}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+
+def delete_expired_refresh_tokens(db: Session):
+    """
+    Delete refresh tokens past their expiry.
+    
+    Revoked but unexpired tokens are kept so reuse can still be detected.
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        int: Number of tokens deleted
+    """
+    count = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.expires_at <= datetime.utcnow())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+
+def watch_query(
+    db: Session,
+    sort: str = None,
+    brand: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    in_stock: bool = False,
+):
+    """
+    Build a filtered, ordered query over watches.
+    
+    Args:
+        db: Database session
+        sort: "popular", "price_asc" or "price_desc" (default: by ID)
+        brand: Only watches of this brand
+        min_price: Inclusive lower price bound
+        max_price: Inclusive upper price bound
+        in_stock: Only watches with stock available
+        
+    Returns:
+        Query: SQLAlchemy query over Watch
+    """
+    query = db.query(Watch)
+    if brand is not None:
+        query = query.filter(Watch.brand == brand)
+    if min_price is not None:
+        query = query.filter(Watch.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Watch.price <= max_price)
+    if in_stock:
+        query = query.filter(Watch.stock > 0)
+    
+    if sort == "popular":
+        query = (
+            query.outerjoin(WatchPopularity, WatchPopularity.watch_id == Watch.id)
+            .order_by(func.coalesce(WatchPopularity.score, 0).desc(), Watch.id)
+        )
+    elif sort == "price_asc":
+        query = query.order_by(Watch.price, Watch.id)
+    elif sort == "price_desc":
+        query = query.order_by(Watch.price.desc(), Watch.id.desc())
+    else:
+        query = query.order_by(Watch.id)
+    return query
+
+
+def get_watches(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    sort: str = None,
+    brand: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    in_stock: bool = False,
+):
     """
     Get all watches with pagination.
     
@@ -76,11 +292,40 @@ def get_watches(db: Session, skip: int = 0, limit: int = 100):
         db: Database session
         skip: Number of records to skip (for pagination)
         limit: Maximum number of records to return
+        sort: "popular" to order by decayed popularity, most popular first,
+            or "price_asc" / "price_desc"
+        brand: Only watches of this brand
+        min_price: Inclusive lower price bound
+        max_price: Inclusive upper price bound
+        in_stock: Only watches with stock available
         
     Returns:
         List[Watch]: List of watch objects
     """
-    return db.query(Watch).offset(skip).limit(limit).all()
+    query = watch_query(
+        db, sort=sort, brand=brand, min_price=min_price, max_price=max_price, in_stock=in_stock
+    )
+    return query.offset(skip).limit(limit).all()
+
+
+def get_watches_by_ids(db: Session, watch_ids):
+    """
+    Get watches by ID, preserving the order of the given IDs.
+    
+    IDs are loaded in chunks to stay under SQLite's bound parameter limit.
+    
+    Args:
+        db: Database session
+        watch_ids: Watch IDs in the desired order
+        
+    Returns:
+        List[Watch]: Watches found, in the given order
+    """
+    by_id = {}
+    for start in range(0, len(watch_ids), ID_CHUNK_SIZE):
+        chunk = watch_ids[start:start + ID_CHUNK_SIZE]
+        by_id.update((w.id, w) for w in db.query(Watch).filter(Watch.id.in_(chunk)).all())
+    return [by_id[watch_id] for watch_id in watch_ids if watch_id in by_id]
 
 
 def get_watch(db: Session, watch_id: int):
@@ -97,10 +342,36 @@ def get_watch(db: Session, watch_id: int):
     return db.query(Watch).filter(Watch.id == watch_id).first()
 
 
+def _lock_watch(db: Session, watch_id: int) -> bool:
+    """
+    Take the write lock on a watch row before reading it for an update.
+    
+    A no-op UPDATE opens the write transaction (the database lock on
+    SQLite, a row lock elsewhere), so a refresh afterwards sees the latest
+    committed row and no concurrent edit can change it before commit.
+    
+    Args:
+        db: Database session
+        watch_id: Watch ID to lock
+        
+    Returns:
+        bool: True if the row still exists
+    """
+    locked = (
+        db.query(Watch)
+        .filter(Watch.id == watch_id)
+        .update({Watch.id: Watch.id}, synchronize_session=False)
+    )
+    return locked > 0
+
+
 def create_watch(db: Session, watch: WatchCreate):
     """
     Create a new watch.
     
+    Brand inventory aggregates are updated in the same transaction,
+    and the similarity index and catalog snapshot are patched after commit.
+    
     Args:
         db: Database session
         watch: WatchCreate schema with validated data
@@ -110,8 +381,12 @@ def create_watch(db: Session, watch: WatchCreate):
     """
     db_watch = Watch(**watch.model_dump())
     db.add(db_watch)
+    db.flush()
+    apply_watch_change(db, None, watch_snapshot(db_watch))
     db.commit()
     db.refresh(db_watch)
+    similarity_index.upsert(db_watch)
+    catalog_snapshot.upsert(db_watch)
     return db_watch
 
 
@@ -119,6 +394,9 @@ def update_watch(db: Session, watch_id: int, watch: WatchUpdate):
     """
     Update an existing watch.
     
+    Brand inventory aggregates are updated in the same transaction,
+    and the similarity index and catalog snapshot are patched after commit.
+    
     Args:
         db: Database session
         watch_id: Watch ID to update
@@ -131,13 +409,25 @@ def update_watch(db: Session, watch_id: int, watch: WatchUpdate):
     if not db_watch:
         return None
     
+    # Aggregate deltas must start from the committed row, not one read
+    # before a concurrent edit committed
+    if not _lock_watch(db, watch_id):
+        db.rollback()
+        return None
+    db.refresh(db_watch)
+    before = watch_snapshot(db_watch)
+    
     # Update only provided fields
     update_data = watch.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_watch, field, value)
     
+    db.flush()
+    apply_watch_change(db, before, watch_snapshot(db_watch))
     db.commit()
     db.refresh(db_watch)
+    similarity_index.upsert(db_watch)
+    catalog_snapshot.upsert(db_watch)
     return db_watch
 
 
@@ -145,6 +435,10 @@ def delete_watch(db: Session, watch_id: int):
     """
     Delete a watch.
     
+    Brand inventory aggregates are updated in the same transaction.
+    After commit the watch leaves the similarity index and catalog
+    snapshot, and its pending view counts are discarded.
+    
     Args:
         db: Database session
         watch_id: Watch ID to delete
@@ -156,6 +450,17 @@ def delete_watch(db: Session, watch_id: int):
     if not db_watch:
         return False
     
+    if not _lock_watch(db, watch_id):
+        db.rollback()
+        return False
+    db.refresh(db_watch)
+    before = watch_snapshot(db_watch)
+    db.query(WatchPopularity).filter(WatchPopularity.watch_id == watch_id).delete(synchronize_session=False)
     db.delete(db_watch)
+    db.flush()
+    apply_watch_change(db, before, None)
     db.commit()
+    similarity_index.remove(watch_id)
+    catalog_snapshot.remove(watch_id)
+    view_counter.discard(watch_id)
     return True
@@ -5,17 +5,28 @@ This file sets up the FastAPI app, configures CORS,
 and defines all API endpoints.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import os
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from database import engine, get_db, Base
+from database import engine, get_db, Base, SessionLocal
 from models import User, Watch
+import analytics
 import crud
 import schemas
-from auth import create_access_token, get_current_user, get_current_admin_user
+from auth import create_access_token, get_current_user, get_current_admin_user, get_user_from_token
+import profiling
+from popularity import view_counter
+from catalog_snapshot import CATALOG_SNAPSHOT_ENABLED, catalog_snapshot
+from similarity import SIMILAR_TOP_K, similarity_index
+from singleflight import SingleFlight, SingleFlightTimeout
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -27,6 +38,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Let sync handlers register their threadpool thread with request profiles
+app.router.route_class = profiling.ProfiledRoute
+
 # Configure CORS to allow frontend requests
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +51,113 @@ app.add_middleware(
 )
 
 
+def is_admin_request(request: Request) -> bool:
+    """Check whether a request carries a valid admin bearer token."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+        return bool(user and user.is_admin)
+    finally:
+        db.close()
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Profile a single request when an admin asks for it.
+    
+    Send "X-Profile: 1" or "?profile=1" with an admin token. The response
+    carries the stored profile's ID in the X-Profile-Id header. The flag
+    is ignored for everyone else. Only the event-loop thread and the
+    handler's thread are sampled.
+    """
+    wants_profile = request.headers.get("X-Profile") == "1" or request.query_params.get("profile") == "1"
+    if not wants_profile or not await run_in_threadpool(is_admin_request, request):
+        return await call_next(request)
+    
+    label = f"{request.method} {request.url.path}"
+    response, profiler = await profiling.profile_request(lambda: call_next(request))
+    
+    profile_id = profiling.new_profile_id(label)
+    await run_in_threadpool(profiling.save_profile, profiler, profile_id, label)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+# Coalesce identical concurrent catalog reads into one query + serialization
+# Waiters give up after SINGLEFLIGHT_TIMEOUT_SECONDS and receive a 503
+watch_reads = SingleFlight(timeout=float(os.getenv("SINGLEFLIGHT_TIMEOUT_SECONDS", "5")))
+
+watch_list_adapter = TypeAdapter(List[schemas.WatchResponse])
+
+# How often in-memory view counts are written to the database
+VIEW_FLUSH_INTERVAL_SECONDS = float(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", "10"))
+
+# How often expired refresh tokens are deleted in the background
+REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS = int(os.getenv("REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS", "3600"))
+background_tasks = []
+
+
+def prune_refresh_tokens():
+    """Delete expired refresh tokens using a dedicated session."""
+    db = SessionLocal()
+    try:
+        return crud.delete_expired_refresh_tokens(db)
+    finally:
+        db.close()
+
+
+def flush_view_counts():
+    """Write pending view counts using a dedicated session."""
+    db = SessionLocal()
+    try:
+        return view_counter.flush(db)
+    finally:
+        db.close()
+
+
+def build_similarity_index():
+    """Build the similarity index from the full catalog using a dedicated session."""
+    db = SessionLocal()
+    try:
+        similarity_index.build(lambda: db.query(Watch).all())
+    finally:
+        db.close()
+    return similarity_index.stats()
+
+
+async def build_similarity_index_in_background():
+    """Build the similarity index off the event loop once the app is serving."""
+    try:
+        stats = await run_in_threadpool(build_similarity_index)
+        print(f"✅ Similarity index built for {stats['watches']} watches")
+    except Exception as exc:
+        print(f"⚠️ Similarity index build failed: {exc}")
+
+
+async def flush_view_counts_periodically():
+    """Background loop that flushes view counts off the event loop."""
+    while True:
+        await asyncio.sleep(VIEW_FLUSH_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(flush_view_counts)
+        except Exception as exc:
+            print(f"⚠️ View count flush failed: {exc}")
+
+
+async def prune_refresh_tokens_periodically():
+    """Background loop that prunes expired refresh tokens off the event loop."""
+    while True:
+        try:
+            await run_in_threadpool(prune_refresh_tokens)
+        except Exception as exc:
+            print(f"⚠️ Refresh token pruning failed: {exc}")
+        await asyncio.sleep(REFRESH_TOKEN_PRUNE_INTERVAL_SECONDS)
+
+
 @app.on_event("startup")
 async def startup_event():
     """
@@ -114,7 +235,33 @@ async def startup_event():
         
         print(f"✅ {len(sample_watches)} sample watches created")
     
+    # Backfill inventory aggregates for catalogs created before they existed,
+    # and recount low stock when LOW_STOCK_THRESHOLD has changed
+    if analytics.inventory_is_stale(db):
+        brands = analytics.rebuild_inventory(db)
+        print(f"✅ Inventory aggregates rebuilt for {brands} brands")
+    
+    # Load the columnar snapshot that serves price range and top-N queries
+    if CATALOG_SNAPSHOT_ENABLED:
+        catalog_snapshot.build(db)
+        print(f"✅ Catalog snapshot built for {catalog_snapshot.memory_usage()['rows']} watches")
+    
     db.close()
+    
+    # Precompute "similar watches" neighbours in the background; the build is
+    # quadratic in catalog size, and /similar answers 503 until it is done
+    background_tasks.append(asyncio.create_task(build_similarity_index_in_background()))
+    background_tasks.append(asyncio.create_task(prune_refresh_tokens_periodically()))
+    background_tasks.append(asyncio.create_task(flush_view_counts_periodically()))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background maintenance tasks and persist pending view counts."""
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    flush_view_counts()
 
 
 @app.get("/")
@@ -169,6 +316,9 @@ def login(
     Authenticates user and returns JWT access token.
     Token should be included in subsequent requests as:
     Authorization: Bearer <token>
+    
+    Also returns a long-lived refresh token; exchange it at /token/refresh
+    for a new access token instead of logging in again.
     """
     user = crud.authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -178,9 +328,35 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
+    # Create access token and start a new refresh token family
+    access_token = create_access_token(data={"sub": user.username})
+    refresh_token = crud.create_refresh_token(db, user.id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token.
+    
+    No password hashing is involved: the refresh token is looked up by its
+    SHA-256 hash. The presented token is rotated - the response contains a
+    new refresh token and the old one stops working. Reusing an already
+    rotated token revokes every token issued from the same login, unless
+    it was rotated within the last few seconds (two tabs refreshing at
+    once). Refreshing never extends the login's original expiry.
+    """
+    rotated = crud.rotate_refresh_token(db, request.refresh_token)
+    if not rotated:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user, refresh_token = rotated
     access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 
 @app.get("/users/me", response_model=schemas.UserResponse)
@@ -193,17 +369,80 @@ def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 
+def _coalesced_read(key, fn):
+    """
+    Run a catalog read through the single-flight layer.
+
+    Returns the shared JSON body, or None if fn found nothing.
+    Raises 503 if this request timed out waiting for an identical one.
+    """
+    try:
+        return watch_reads.do(key, fn)
+    except SingleFlightTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Catalog is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
 @app.get("/watches", response_model=List[schemas.WatchResponse])
-def list_watches(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_watches(
+    skip: int = 0,
+    limit: int = 100,
+    sort: Optional[str] = Query(None, pattern="^(popular|price_asc|price_desc)$"),
+    brand: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+    db: Session = Depends(get_db)
+):
     """
     Get all watches (public endpoint).
     
     Query parameters:
     - skip: Number of records to skip (pagination)
     - limit: Maximum number of records to return
+    - sort: "popular" to order by recent views, most popular first,
+      or "price_asc" / "price_desc"
+    - brand: Only watches of this brand
+    - min_price / max_price: Inclusive price range
+    - in_stock: Only watches with stock available
+    
+    Price range, brand, stock and price-sorted queries are answered from
+    the in-memory catalog snapshot; only the matching rows are then loaded
+    from the database by ID. Both paths return rows in ID order unless
+    sorted by price or popularity.
+    Identical concurrent requests share one query and one serialized body.
     """
-    watches = crud.get_watches(db, skip=skip, limit=limit)
-    return watches
+    filtered = (
+        sort in ("price_asc", "price_desc") or brand is not None or in_stock
+        or min_price is not None or max_price is not None
+    )
+    
+    def load():
+        if filtered and sort != "popular" and catalog_snapshot.built:
+            ids = catalog_snapshot.query(
+                min_price=min_price,
+                max_price=max_price,
+                brand=brand,
+                in_stock=in_stock,
+                sort=sort,
+                skip=skip,
+                limit=limit,
+            )
+            watches = crud.get_watches_by_ids(db, ids)
+        else:
+            watches = crud.get_watches(
+                db, skip=skip, limit=limit, sort=sort, brand=brand,
+                min_price=min_price, max_price=max_price, in_stock=in_stock
+            )
+        return watch_list_adapter.dump_json(watches)
+    
+    body = _coalesced_read(
+        ("list_watches", skip, limit, sort, brand, min_price, max_price, in_stock), load
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/watches/{watch_id}", response_model=schemas.WatchResponse)
@@ -212,14 +451,48 @@ def get_watch(watch_id: int, db: Session = Depends(get_db)):
     Get a single watch by ID (public endpoint).
     
     Raises 404 if watch not found.
+    Identical concurrent requests share one query and one serialized body.
+    Views are counted in memory and flushed to the database in batches.
+    """
+    def load():
+        watch = crud.get_watch(db, watch_id)
+        if not watch:
+            return None
+        return schemas.WatchResponse.model_validate(watch).model_dump_json().encode()
+
+    body = _coalesced_read(("get_watch", watch_id), load)
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Watch not found"
+        )
+    view_counter.record(watch_id)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/watches/{watch_id}/similar", response_model=List[schemas.WatchResponse])
+def similar_watches(watch_id: int, limit: int = Query(4, ge=1, le=SIMILAR_TOP_K)):
     """
-    watch = crud.get_watch(db, watch_id)
-    if not watch:
+    Get watches similar to the given one (public endpoint).
+    
+    Served from the precomputed in-memory similarity index - no database
+    access. Similarity blends TF-IDF over name, brand and description
+    with price proximity.
+    
+    Raises 404 if watch not found, 503 while the index is still being built.
+    """
+    if not similarity_index.built:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Similarity index is still being built"
+        )
+    body = similarity_index.similar(watch_id, limit)
+    if body is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Watch not found"
         )
-    return watch
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/watches", response_model=schemas.WatchResponse, status_code=status.HTTP_201_CREATED)
@@ -276,3 +549,155 @@ def delete_watch(
             detail="Watch not found"
         )
     return None
+
+
+@app.get("/admin/stats/coalescing", response_model=schemas.CoalescingStats)
+def coalescing_stats(current_user: User = Depends(get_current_admin_user)):
+    """
+    Report how many catalog reads were collapsed by single-flight (admin only).
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    return watch_reads.stats()
+
+
+@app.get("/admin/analytics/inventory", response_model=schemas.InventoryAnalytics)
+def inventory_analytics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Get inventory value, stock and price stats per brand (admin only).
+    
+    Served from incrementally maintained aggregates - no scan of watches.
+    Requires: Valid JWT token with admin privileges
+    """
+    return analytics.get_inventory_summary(db)
+
+
+@app.post("/admin/analytics/inventory/rebuild", response_model=schemas.InventoryAnalytics)
+def rebuild_inventory_analytics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Recompute inventory aggregates from a full scan of watches (admin only).
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    analytics.rebuild_inventory(db)
+    return analytics.get_inventory_summary(db)
+
+
+@app.get("/admin/analytics/inventory/check", response_model=schemas.InventoryConsistency)
+def check_inventory_analytics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Compare inventory aggregates against a full scan of watches (admin only).
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    mismatches = analytics.check_inventory(db)
+    return {"consistent": not mismatches, "mismatches": mismatches}
+
+
+@app.post("/admin/similarity/rebuild", response_model=schemas.SimilarityIndexStats)
+def rebuild_similarity_index(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Rebuild this worker's similarity index from the full catalog (admin only).
+    
+    Refreshes the vocabulary and IDF weights, which incremental updates keep fixed.
+    Requires: Valid JWT token with admin privileges
+    """
+    similarity_index.build(lambda: db.query(Watch).all())
+    return similarity_index.stats()
+
+
+@app.post("/admin/profiling/sample", response_model=schemas.ProfileRun, status_code=status.HTTP_202_ACCEPTED)
+def start_sampling_profile(
+    seconds: float = Query(10, gt=0, le=300),
+    interval_ms: float = Query(profiling.WORKER_SAMPLE_INTERVAL * 1000, ge=1, le=1000),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Sample this worker for N seconds in the background (admin only).
+    
+    The profile becomes downloadable under the returned ID once the run
+    finishes. Only one run per worker can be active at a time.
+    Requires: Valid JWT token with admin privileges
+    """
+    profile_id = profiling.start_worker_profile(seconds, interval_ms / 1000)
+    if profile_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A sampling run is already in progress"
+        )
+    return {"profile_id": profile_id, "seconds": seconds, "interval_ms": interval_ms}
+
+
+@app.get("/admin/profiling/profiles", response_model=schemas.ProfileList)
+def list_profiles(current_user: User = Depends(get_current_admin_user)):
+    """
+    List stored profiles, newest first (admin only).
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    return {"profiles": profiling.list_profiles()}
+
+
+@app.get("/admin/profiling/profiles/{profile_id}")
+def download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|folded)$"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Download a stored profile (admin only).
+    
+    Query parameters:
+    - format: "speedscope" (JSON for speedscope.app) or "folded" (flamegraph.pl)
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    path = profiling.profile_path(profile_id, format)
+    if not profiling.PROFILE_ID_RE.match(profile_id) or not os.path.isfile(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@app.get("/admin/stats/catalog-snapshot", response_model=schemas.CatalogSnapshotStats)
+def catalog_snapshot_stats(current_user: User = Depends(get_current_admin_user)):
+    """
+    Report this worker's catalog snapshot memory use (admin only).
+    
+    Requires: Valid JWT token with admin privileges
+    """
+    return {"enabled": catalog_snapshot.built, **catalog_snapshot.memory_usage()}
+
+
+@app.post("/admin/catalog-snapshot/rebuild", response_model=schemas.CatalogSnapshotStats)
+def rebuild_catalog_snapshot(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Reload this worker's catalog snapshot from the database (admin only).
+    
+    Returns 409 when the snapshot is disabled with CATALOG_SNAPSHOT_ENABLED=0.
+    Requires: Valid JWT token with admin privileges
+    """
+    if not CATALOG_SNAPSHOT_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Catalog snapshot is disabled"
+        )
+    catalog_snapshot.build(db)
+    return {"enabled": catalog_snapshot.built, **catalog_snapshot.memory_usage()}
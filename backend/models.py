@@ -1,10 +1,12 @@
 """
 SQLAlchemy database models.
 
-Defines the database table structures for User and Watch entities.
+Defines the database table structures for User, Watch, RefreshToken,
+BrandInventory, InventoryState, WatchPopularity and PopularityEpoch
+entities.
 """
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
 from sqlalchemy.sql import func
 from database import Base
 
@@ -55,3 +57,117 @@ class Watch(Base):
     image_url = Column(String, nullable=False)
     stock = Column(Integer, default=0, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RefreshToken(Base):
+    """
+    Long-lived refresh token used to obtain new access tokens without a password.
+    
+    Only a SHA-256 hash of the token is stored. Tokens are single-use:
+    each refresh revokes the presented token and issues a new one in the
+    same family, so presenting a revoked token signals theft and revokes
+    the whole family - unless its successor was issued moments ago, which
+    means two clients refreshed at once. Every token in a family shares
+    the expiry set at login.
+    
+    Attributes:
+        id: Primary key
+        user_id: Owner of the token
+        token_hash: SHA-256 hex digest of the token (unique, indexed lookup)
+        family_id: Shared by every token rotated from the same login
+        expires_at: Timestamp after which the token is rejected and pruned,
+            fixed for the whole family at login
+        revoked: Boolean flag set once the token is used or its family revoked
+        created_at: Timestamp when the token was issued
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BrandInventory(Base):
+    """
+    Per-brand inventory aggregates, maintained incrementally on watch writes.
+    
+    Lets admin analytics be served without scanning the watches table.
+    Average price is derived as price_sum / watch_count.
+    
+    Attributes:
+        brand: Primary key, matches Watch.brand
+        watch_count: Number of watches of this brand
+        stock_units: Sum of stock across the brand's watches
+        stock_value: Sum of price * stock across the brand's watches
+        price_sum: Sum of prices, used for the average price
+        min_price: Lowest price among the brand's watches
+        max_price: Highest price among the brand's watches
+        low_stock_count: Watches with stock at or below the low stock threshold
+    """
+    __tablename__ = "brand_inventory"
+
+    brand = Column(String, primary_key=True)
+    watch_count = Column(Integer, default=0, nullable=False)
+    stock_units = Column(Integer, default=0, nullable=False)
+    stock_value = Column(Float, default=0.0, nullable=False)
+    price_sum = Column(Float, default=0.0, nullable=False)
+    min_price = Column(Float, nullable=False)
+    max_price = Column(Float, nullable=False)
+    low_stock_count = Column(Integer, default=0, nullable=False)
+
+
+class InventoryState(Base):
+    """
+    Settings the brand_inventory aggregates were computed with (a single row).
+    
+    low_stock_count depends on the threshold, so the aggregates are rebuilt
+    when LOW_STOCK_THRESHOLD no longer matches the stored value.
+    
+    Attributes:
+        id: Primary key, always 1
+        low_stock_threshold: Threshold used for low_stock_count
+    """
+    __tablename__ = "inventory_state"
+
+    id = Column(Integer, primary_key=True)
+    low_stock_threshold = Column(Integer, nullable=False)
+
+
+class WatchPopularity(Base):
+    """
+    View counts and popularity score per watch, written in batches.
+    
+    Attributes:
+        watch_id: Primary key, the viewed watch
+        view_count: Total views
+        score: Views weighted by recency relative to PopularityEpoch
+            (see popularity.view_weight); higher means more popular right now
+        updated_at: Timestamp of the last flush that touched this row
+    """
+    __tablename__ = "watch_popularity"
+
+    watch_id = Column(Integer, ForeignKey("watches.id", ondelete="CASCADE"), primary_key=True)
+    view_count = Column(Integer, default=0, nullable=False)
+    score = Column(Float, default=0.0, nullable=False, index=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class PopularityEpoch(Base):
+    """
+    Reference time of the stored popularity scores (a single row).
+    
+    A view at started_at weighs 1. When the weights grow too large, the
+    epoch moves forward and every stored score is rescaled to match.
+    
+    Attributes:
+        id: Primary key, always 1
+        started_at: Time at which a view weighs 1
+    """
+    __tablename__ = "popularity_epoch"
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, nullable=False)
@@ -0,0 +1,231 @@
+"""
+Write-behind product view counting and popularity scores.
+
+Views are counted in memory, in per-thread shards so concurrent requests
+never contend on a shared lock, and flushed periodically to the
+watch_popularity table in one batched upsert.
+
+Popularity decays exponentially with a configurable half-life. Instead of
+rewriting every score as time passes, each view is stored with weight
+2 ** (half-lives since the epoch). Every score then decays by the same
+factor, so ordering by the stored score equals ordering by the decayed
+score and can use an index.
+
+The weights would overflow a float after about 1024 half-lives, so the
+epoch is kept in the popularity_epoch table. Once it is
+POPULARITY_REBASE_HALF_LIVES old, a flush moves it forward by a whole
+number of half-lives and divides every stored score by the same power of
+two, in the same transaction as the upsert.
+"""
+
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import bindparam, exists, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from models import PopularityEpoch, Watch, WatchPopularity
+
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "168"))
+POPULARITY_EPOCH = datetime(2025, 1, 1)
+VIEW_SHARDS = int(os.getenv("VIEW_SHARDS", "16"))
+
+# Epoch age, in half-lives, at which it is moved forward (weights reach 2 ** 64)
+POPULARITY_REBASE_HALF_LIVES = 64
+
+
+def half_lives_since(epoch: datetime, now: datetime) -> float:
+    """Number of popularity half-lives between epoch and now."""
+    return (now - epoch).total_seconds() / 3600 / POPULARITY_HALF_LIFE_HOURS
+
+
+def view_weight(now: datetime = None, epoch: datetime = POPULARITY_EPOCH) -> float:
+    """
+    Weight of a single view recorded at the given time.
+
+    Args:
+        now: Time of the view (defaults to the current UTC time)
+        epoch: Time at which a view weighs 1 (see PopularityEpoch)
+
+    Returns:
+        float: 2 ** (half-lives since epoch)
+    """
+    now = now or datetime.utcnow()
+    return 2.0 ** half_lives_since(epoch, now)
+
+
+def current_epoch(db: Session, now: datetime) -> datetime:
+    """
+    Load the popularity epoch, moving it forward first if it is too old.
+
+    Creates the epoch row on first use. The insert is the transaction's
+    first write, so it also takes the write lock: concurrent flushes from
+    other workers wait, and the epoch cannot be rebased twice.
+
+    Args:
+        db: Database session, in the flush transaction
+        now: Time of the flush
+
+    Returns:
+        datetime: Epoch the flushed views must be weighted against
+    """
+    db.execute(
+        insert(PopularityEpoch)
+        .values(id=1, started_at=POPULARITY_EPOCH)
+        .on_conflict_do_nothing(index_elements=[PopularityEpoch.id])
+    )
+    epoch = db.query(PopularityEpoch.started_at).filter(PopularityEpoch.id == 1).scalar()
+
+    elapsed = half_lives_since(epoch, now)
+    if elapsed < POPULARITY_REBASE_HALF_LIVES:
+        return epoch
+
+    # Shift by whole half-lives so the rescale is an exact power of two
+    shift = int(elapsed)
+    epoch += timedelta(hours=shift * POPULARITY_HALF_LIFE_HOURS)
+    db.query(WatchPopularity).update(
+        {WatchPopularity.score: WatchPopularity.score * 2.0 ** -shift}, synchronize_session=False
+    )
+    db.query(PopularityEpoch).filter(PopularityEpoch.id == 1).update(
+        {PopularityEpoch.started_at: epoch}, synchronize_session=False
+    )
+    return epoch
+
+
+class _Shard:
+    """One lock-protected slice of the pending view counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[int, int] = {}
+
+
+class ViewCounter:
+    """
+    Sharded in-memory view counts awaiting a flush to the database.
+
+    Each thread is pinned to one shard, so the request path only takes an
+    uncontended lock.
+
+    Args:
+        shards: Number of shards
+        enabled: Whether record() counts anything
+    """
+
+    def __init__(self, shards: int = VIEW_SHARDS, enabled: bool = True):
+        self.enabled = enabled
+        self._shards = [_Shard() for _ in range(shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def record(self, watch_id: int):
+        """
+        Count one view of a watch.
+
+        Args:
+            watch_id: Viewed watch ID
+        """
+        if not self.enabled:
+            return
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._shards[next(self._next_shard) % len(self._shards)]
+            self._local.shard = shard
+        with shard.lock:
+            shard.counts[watch_id] = shard.counts.get(watch_id, 0) + 1
+
+    def drain(self) -> Dict[int, int]:
+        """
+        Take and merge all pending counts, leaving the shards empty.
+
+        Returns:
+            dict: Watch ID mapped to views since the last drain
+        """
+        merged: Dict[int, int] = {}
+        for shard in self._shards:
+            with shard.lock:
+                counts, shard.counts = shard.counts, {}
+            for watch_id, count in counts.items():
+                merged[watch_id] = merged.get(watch_id, 0) + count
+        return merged
+
+    def restore(self, counts: Dict[int, int]):
+        """
+        Put drained counts back after a failed flush.
+
+        Args:
+            counts: Counts previously returned by drain()
+        """
+        shard = self._shards[0]
+        with shard.lock:
+            for watch_id, count in counts.items():
+                shard.counts[watch_id] = shard.counts.get(watch_id, 0) + count
+
+    def discard(self, watch_id: int):
+        """
+        Drop pending views of a deleted watch.
+
+        Args:
+            watch_id: ID of the deleted watch
+        """
+        for shard in self._shards:
+            with shard.lock:
+                shard.counts.pop(watch_id, None)
+
+    def flush(self, db: Session, now: datetime = None) -> int:
+        """
+        Write pending counts to the database in one batched upsert.
+
+        Counts are restored in memory if the write fails. Views of watches
+        deleted since they were counted are dropped: SQLite does not enforce
+        the foreign key, and the ID may later be reused by a new watch.
+
+        Args:
+            db: Database session
+            now: Time of the flush (defaults to the current UTC time)
+
+        Returns:
+            int: Number of watches whose counters were written
+        """
+        counts = self.drain()
+        if not counts:
+            return 0
+
+        # INSERT ... SELECT ... WHERE EXISTS checks the watch in the same
+        # statement, so a delete committed mid-flush cannot slip through
+        table = WatchPopularity.__table__
+        columns = [table.c.watch_id, table.c.view_count, table.c.score, table.c.updated_at]
+        values = select(
+            *(bindparam(column.name, type_=column.type) for column in columns)
+        ).where(exists().where(Watch.id == bindparam("watch_id")))
+        stmt = insert(table).from_select(columns, values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WatchPopularity.watch_id],
+            set_={
+                "view_count": WatchPopularity.view_count + stmt.excluded.view_count,
+                "score": WatchPopularity.score + stmt.excluded.score,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        now = now or datetime.utcnow()
+        try:
+            weight = view_weight(now, current_epoch(db, now))
+            rows = [
+                {"watch_id": watch_id, "view_count": count, "score": count * weight, "updated_at": now}
+                for watch_id, count in counts.items()
+            ]
+            written = db.execute(stmt, rows).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.restore(counts)
+            raise
+        return written
+
+
+# Process-wide counter used by the API
+view_counter = ViewCounter(enabled=os.getenv("VIEW_COUNTING_ENABLED", "1") == "1")
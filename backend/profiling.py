@@ -0,0 +1,349 @@
+"""
+On-demand request profiling and a low-overhead sampling profiler.
+
+A background thread periodically snapshots the Python stacks of every
+other thread with sys._current_frames(). Idle threads (waiting on a lock
+or in the event loop's select) are skipped, so the samples show where
+time goes: SQLAlchemy, Pydantic, JSON encoding, bcrypt, and so on.
+
+Profiles are written to PROFILE_DIR in two formats:
+- <id>.speedscope.json: open at https://www.speedscope.app
+- <id>.folded: collapsed stacks for flamegraph.pl (speedscope reads these too)
+
+A per-request profile samples only the event-loop thread and the
+threadpool thread running the route handler. Routes register that thread
+through ProfiledRoute, so concurrent requests stay out of the profile.
+Sync dependencies may run on other pool threads and are not sampled.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi.routing import APIRoute
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_DEPTH = 128
+
+# Sampling intervals in seconds for single requests and worker-wide runs
+REQUEST_SAMPLE_INTERVAL = 0.001
+WORKER_SAMPLE_INTERVAL = 0.005
+
+PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Shorten library paths to their package-relative part
+_LIBRARY_PREFIX_RE = re.compile(r"(?:[\\/](?:site-packages|lib[\\/]python[\d.]+))+[\\/]")
+
+# Leaf frames of threads that are blocked rather than doing work. An idle
+# asyncio loop sits in selectors.select; uvloop polls in C, so its idle
+# loop thread's last Python frame is the asyncio runner
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("asyncio/runners.py", "run"),
+    ("concurrent/futures/thread.py", "_worker"),
+}
+
+# Profiler of the request being handled, if it is being profiled
+current_request_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar(
+    "current_request_profiler", default=None
+)
+
+Frame = Tuple[str, str, int]
+
+
+def _frame_key(frame) -> Frame:
+    """Describe a frame by function name, short file path and first line."""
+    code = frame.f_code
+    parts = _LIBRARY_PREFIX_RE.split(code.co_filename)
+    filename = parts[-1] if len(parts) > 1 else os.path.basename(code.co_filename)
+    return (code.co_name, filename, code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """
+    Periodically sample the stacks of all other threads.
+
+    Samples are aggregated per distinct stack, so memory stays bounded by
+    the number of distinct code paths rather than the duration.
+
+    Args:
+        interval: Seconds between samples
+        threads: Idents of the threads to sample (default: all); more can
+            be added while sampling with add_thread()
+    """
+
+    def __init__(self, interval: float = WORKER_SAMPLE_INTERVAL, threads: Optional[Set[int]] = None):
+        self.interval = interval
+        self.threads = None if threads is None else set(threads)
+        self.samples: Counter = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+
+    def start(self):
+        """Begin sampling in a daemon thread."""
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def add_thread(self, thread_id: int):
+        """Start sampling another thread (no-op when sampling all threads)."""
+        if self.threads is not None:
+            self.threads.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        """Stop sampling a thread added with add_thread()."""
+        if self.threads is not None:
+            self.threads.discard(thread_id)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.threads is not None and thread_id not in self.threads):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    stack.append(_frame_key(frame))
+                    frame = frame.f_back
+                if not stack or (stack[0][1], stack[0][0]) in _IDLE_LEAVES:
+                    continue
+                thread = (f"thread {names.get(thread_id, thread_id)}", "", 0)
+                stack.append(thread)
+                stack.reverse()
+                self.samples[tuple(stack)] += weight
+
+    def to_folded(self) -> str:
+        """
+        Export samples as collapsed stacks, one "root;...;leaf weight" per line.
+
+        Weights are in microseconds.
+        """
+        lines = []
+        for stack, weight in self.samples.most_common():
+            names = ";".join(
+                f"{name} ({filename}:{line})" if filename else name
+                for name, filename, line in stack
+            )
+            lines.append(f"{names} {int(weight * 1e6)}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str) -> dict:
+        """
+        Export samples in the speedscope sampled-profile file format.
+
+        Args:
+            name: Profile title shown in speedscope
+        """
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        samples = []
+        weights = []
+        for stack, weight in self.samples.items():
+            sample = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frame_name, filename, line = key
+                    frame = {"name": frame_name}
+                    if filename:
+                        frame.update(file=filename, line=line)
+                    frames.append(frame)
+                sample.append(index[key])
+            samples.append(sample)
+            weights.append(weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "luxury-watches-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+async def profile_request(call: Callable[[], Awaitable[Any]]):
+    """
+    Await a request while sampling only the threads working on it.
+
+    Samples the calling event-loop thread, plus any handler thread that
+    registers itself through ProfiledRoute while the call runs.
+
+    Args:
+        call: Runs the request, e.g. the middleware's call_next
+
+    Returns:
+        tuple: (result of call, stopped profiler)
+    """
+    profiler = SamplingProfiler(REQUEST_SAMPLE_INTERVAL, threads={threading.get_ident()})
+    token = current_request_profiler.set(profiler)
+    profiler.start()
+    try:
+        result = await call()
+    finally:
+        profiler.stop()
+        current_request_profiler.reset(token)
+    return result, profiler
+
+
+def _register_handler_thread(endpoint: Callable) -> Callable:
+    """Wrap a sync handler so an active request profile also samples its thread."""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiler = current_request_profiler.get()
+        if profiler is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profiler.add_thread(thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.remove_thread(thread_id)
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """
+    API route whose sync handler joins the active request profile.
+
+    Context variables are copied into the threadpool, so the handler sees
+    the profiler set by profile_request() and adds its own thread. Async
+    handlers run on the already sampled event-loop thread.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _register_handler_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def new_profile_id(label: str) -> str:
+    """
+    Build a unique, filesystem-safe profile ID.
+
+    Args:
+        label: Short description, e.g. "GET /watches"
+    """
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")[:60]
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{slug}"
+
+
+def save_profile(profiler: SamplingProfiler, profile_id: str, label: str):
+    """
+    Write a profile in speedscope and folded formats and prune old files.
+
+    Args:
+        profiler: Stopped profiler
+        profile_id: ID from new_profile_id()
+        label: Profile title
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile_id, "speedscope"), "w") as f:
+        json.dump(profiler.to_speedscope(label), f)
+    with open(profile_path(profile_id, "folded"), "w") as f:
+        f.write(profiler.to_folded())
+
+    for old_id in list_profiles()[PROFILE_MAX_FILES:]:
+        for fmt in ("speedscope", "folded"):
+            try:
+                os.remove(profile_path(old_id, fmt))
+            except FileNotFoundError:
+                pass
+
+
+def profile_path(profile_id: str, fmt: str) -> str:
+    """
+    Path of a stored profile file.
+
+    Args:
+        profile_id: Profile ID
+        fmt: "speedscope" or "folded"
+    """
+    suffix = ".speedscope.json" if fmt == "speedscope" else ".folded"
+    return os.path.join(PROFILE_DIR, profile_id + suffix)
+
+
+def list_profiles() -> List[str]:
+    """
+    List stored profile IDs, newest first.
+
+    Returns:
+        List[str]: Profile IDs
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = [
+        name[: -len(".speedscope.json")]
+        for name in os.listdir(PROFILE_DIR)
+        if name.endswith(".speedscope.json")
+    ]
+    return sorted(ids, reverse=True)
+
+
+_worker_run_lock = threading.Lock()
+
+
+def start_worker_profile(seconds: float, interval: float = WORKER_SAMPLE_INTERVAL) -> Optional[str]:
+    """
+    Sample the whole worker for a number of seconds in the background.
+
+    Only one worker-wide run can be active at a time.
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+
+    Returns:
+        str: ID the profile will be saved under, or None if a run is active
+    """
+    if not _worker_run_lock.acquire(blocking=False):
+        return None
+    label = f"worker {seconds:g}s"
+    profile_id = new_profile_id(label)
+
+    def run():
+        try:
+            profiler = SamplingProfiler(interval)
+            profiler.start()
+            # Event.wait keeps this thread's own stack classified as idle
+            threading.Event().wait(seconds)
+            profiler.stop()
+            save_profile(profiler, profile_id, label)
+        finally:
+            _worker_run_lock.release()
+
+    threading.Thread(target=run, name="worker-profile", daemon=True).start()
+    return profile_id
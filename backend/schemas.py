@@ -7,7 +7,7 @@ They provide automatic type checking, data validation, and API documentation.
 
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 import re
 
 
@@ -70,6 +70,12 @@ class Token(BaseModel):
     """Schema for JWT token response."""
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    """Schema for exchanging a refresh token for a new token pair."""
+    refresh_token: str = Field(..., min_length=1)
 
 
 class TokenData(BaseModel):
@@ -118,3 +124,70 @@ class WatchResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class CoalescingStats(BaseModel):
+    """Schema for single-flight request coalescing metrics."""
+    executions: int = Field(..., description="Reads that actually hit the database")
+    coalesced: int = Field(..., description="Requests served by joining an in-flight read")
+    timeouts: int = Field(..., description="Waiters that gave up on the in-flight read")
+    errors: int = Field(..., description="Reads whose error was propagated to all waiters")
+    in_flight: int = Field(..., description="Reads currently executing")
+
+
+class BrandInventoryStats(BaseModel):
+    """Schema for per-brand inventory aggregates."""
+    brand: str
+    watch_count: int
+    stock_units: int
+    stock_value: float
+    min_price: float
+    max_price: float
+    avg_price: float
+    low_stock_count: int
+
+
+class InventoryAnalytics(BaseModel):
+    """Schema for the admin inventory report."""
+    brands: List[BrandInventoryStats]
+    watch_count: int
+    stock_units: int
+    stock_value: float
+    low_stock_count: int
+    low_stock_threshold: int
+
+
+class InventoryConsistency(BaseModel):
+    """Schema for the inventory aggregate consistency check."""
+    consistent: bool
+    mismatches: List[str]
+
+
+class SimilarityIndexStats(BaseModel):
+    """Schema for the similarity index size."""
+    watches: int
+    vocabulary: int
+    matrix_bytes: int
+
+
+class ProfileRun(BaseModel):
+    """Schema for a started worker-wide sampling run."""
+    profile_id: str
+    seconds: float
+    interval_ms: float
+
+
+class ProfileList(BaseModel):
+    """Schema for stored profiles, newest first."""
+    profiles: List[str]
+
+
+class CatalogSnapshotStats(BaseModel):
+    """Schema for the in-memory catalog snapshot size."""
+    enabled: bool
+    rows: int
+    slots: int
+    brands: int
+    array_bytes: Dict[str, int]
+    lookup_bytes: int
+    total_bytes: int
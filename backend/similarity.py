@@ -0,0 +1,516 @@
+"""
+"Similar watches" recommendations from a precomputed similarity index.
+
+Name, brand and description are vectorized with TF-IDF. Each watch keeps
+only its strongest terms, as fixed-width rows of term IDs and float32
+weights, so memory grows with the catalog, not the vocabulary. Each
+watch's top-k neighbours, scored by text similarity blended with price
+proximity, are precomputed so a lookup is a dictionary access.
+
+The index is built in full in the background on startup. Each crud write
+then scores only the written watch, through a term -> rows inverted
+index, and patches the neighbour lists it affects. Writers serialize on
+a lock, and lookups never take it: changed neighbour lists are published
+by replacing dictionary entries, which is atomic.
+
+The index lives in process memory, so every worker holds its own copy and
+only sees writes it handled itself until its next full rebuild.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from schemas import WatchResponse
+
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "10"))
+SIMILARITY_MAX_FEATURES = int(os.getenv("SIMILARITY_MAX_FEATURES", "5000"))
+
+# Highest-weighted terms kept per watch (width of the term/weight rows)
+MAX_TERMS_PER_WATCH = 64
+
+# Weight of text similarity vs price proximity in the neighbour score
+TEXT_WEIGHT = 0.8
+PRICE_WEIGHT = 0.2
+
+# Rows scored per sparse matrix multiplication
+_BLOCK_SIZE = 256
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or s that the this to with".split()
+)
+
+
+def tokenize(watch):
+    """
+    Turn a watch into TF-IDF terms.
+
+    Name and brand terms are counted twice so they outweigh the longer
+    description.
+
+    Args:
+        watch: Watch object
+
+    Returns:
+        List[str]: Terms with stop words removed
+    """
+    def terms(text):
+        return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+    return terms(watch.name) * 2 + terms(watch.brand) * 2 + terms(watch.description)
+
+
+class _Postings:
+    """Rows containing one term and the term's weight in each, grown by doubling."""
+
+    __slots__ = ("rows", "weights", "size")
+
+    def __init__(self, rows, weights):
+        self.rows = rows
+        self.weights = weights
+        self.size = len(rows)
+
+    def append(self, row: int, weight: float):
+        if self.size == len(self.rows):
+            capacity = max(8, 2 * self.size)
+            self.rows = np.resize(self.rows, capacity)
+            self.weights = np.resize(self.weights, capacity)
+        self.rows[self.size] = row
+        self.weights[self.size] = weight
+        self.size += 1
+
+
+class _RowStore:
+    """
+    Writer-side TF-IDF rows, inverted index and neighbour lists.
+
+    Per-watch state lives in slot-aligned arrays: term IDs and weights
+    (padded with a sentinel term of weight 0), price, watch ID, a live
+    flag, and the neighbour IDs and scores (padded with -1 and -inf).
+    Slots are append-only, so posting lists only ever grow. An updated
+    watch gets a new slot and its old one is marked dead. Dead slots are
+    dropped when the arrays are full, instead of growing them.
+
+    Args:
+        vocab: Term -> column mapping
+        idf: IDF weight per column
+        top_k: Number of neighbours kept per watch
+        capacity: Initial number of slots
+    """
+
+    # Slot arrays and their padding values (None: the sentinel term)
+    _FILLS = (
+        ("terms", None), ("weights", 0), ("prices", 0), ("ids", 0), ("live", False),
+        ("neighbour_ids", -1), ("neighbour_scores", -np.inf),
+    )
+
+    def __init__(self, vocab: Dict[str, int], idf, top_k: int, capacity: int = 0):
+        self.vocab = vocab
+        self.idf = idf
+        self.top_k = top_k
+        self.sentinel = len(vocab)
+        self.n = 0
+        self.slots: Dict[int, int] = {}
+        self.terms = np.full((capacity, MAX_TERMS_PER_WATCH), self.sentinel, dtype=np.int32)
+        self.weights = np.zeros((capacity, MAX_TERMS_PER_WATCH), dtype=np.float32)
+        self.prices = np.zeros(capacity, dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.neighbour_ids = np.full((capacity, top_k), -1, dtype=np.int64)
+        self.neighbour_scores = np.full((capacity, top_k), -np.inf, dtype=np.float32)
+        self.postings: List[_Postings] = []
+
+    def load(self, watches, docs):
+        """Fill an empty store with every watch, then index and rank them all."""
+        for watch, doc in zip(watches, docs):
+            self._write(self.n, watch.id, doc, watch.price)
+            self.n += 1
+        self.index_postings()
+        self.rank_all()
+
+    def add(self, watch_id: int, doc, price: float) -> int:
+        """Append one watch to a new slot and the inverted index; returns its slot."""
+        if self.n == len(self.ids):
+            if 2 * (self.n - len(self.slots)) >= self.n > 0:
+                self.compact()
+            else:
+                self.grow(max(16, 2 * self.n))
+        slot = self.n
+        self.n += 1
+        self._write(slot, watch_id, doc, price)
+        for i in range(MAX_TERMS_PER_WATCH):
+            col = self.terms[slot, i]
+            if col == self.sentinel:
+                break
+            self.postings[col].append(slot, self.weights[slot, i])
+        return slot
+
+    def kill(self, watch_id: int) -> bool:
+        """Mark a watch's slot dead; returns whether the watch was present."""
+        slot = self.slots.pop(watch_id, None)
+        if slot is None:
+            return False
+        self.live[slot] = False
+        return True
+
+    def scores(self, slot: int):
+        """Blend cosine similarity and price proximity of one slot against all slots (float32)."""
+        n = self.n
+        text = np.zeros(n, dtype=np.float32)
+        for col, weight in zip(self.terms[slot], self.weights[slot]):
+            if col == self.sentinel:
+                break
+            postings = self.postings[col]
+            text[postings.rows[:postings.size]] += weight * postings.weights[:postings.size]
+        price = self._price_proximity(np.array([slot]))[0]
+        scores = np.float32(TEXT_WEIGHT) * text + np.float32(PRICE_WEIGHT) * price
+        scores[~self.live[:n]] = -np.inf
+        scores[slot] = -np.inf
+        return scores
+
+    def rank(self, slots):
+        """Recompute the neighbour lists of the given slots from the inverted index."""
+        for slot in slots:
+            self.set_top(np.array([slot]), self.scores(slot)[None, :])
+
+    def rank_all(self):
+        """Recompute every neighbour list with blockwise sparse products (full builds)."""
+        n = self.n
+        mask = self.terms[:n] != self.sentinel
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(mask.sum(axis=1), out=indptr[1:])
+        matrix = sparse.csr_matrix(
+            (self.weights[:n][mask], self.terms[:n][mask], indptr), shape=(n, self.sentinel)
+        )
+        transposed = matrix.T.tocsr()
+        for start in range(0, n, _BLOCK_SIZE):
+            block = np.arange(start, min(start + _BLOCK_SIZE, n))
+            text = (matrix[block] @ transposed).toarray()
+            price = self._price_proximity(block)
+            scores = np.float32(TEXT_WEIGHT) * text + np.float32(PRICE_WEIGHT) * price
+            scores[:, ~self.live[:n]] = -np.inf
+            scores[np.arange(len(block)), block] = -np.inf
+            self.set_top(block, scores)
+
+    def set_top(self, slots, scores):
+        """Store the top-k of each row of scores as the neighbours of slots."""
+        self.neighbour_ids[slots] = -1
+        self.neighbour_scores[slots] = -np.inf
+        k = min(self.top_k, len(self.slots) - 1)
+        if k <= 0:
+            return
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        self.neighbour_ids[slots, :k] = self.ids[np.take_along_axis(top, order, axis=1)]
+        self.neighbour_scores[slots, :k] = np.take_along_axis(top_scores, order, axis=1)
+
+    def offer(self, slot: int, scores):
+        """
+        Patch other neighbour lists after the watch in slot was written.
+
+        Lists that already held the watch update its score in place, or are
+        re-ranked in full if it dropped below their weakest score (another
+        watch may now beat it). Lists whose weakest score it beats take it
+        in place of the weakest.
+
+        Returns:
+            ndarray: Slots whose neighbour lists changed
+        """
+        n = self.n
+        watch_id = self.ids[slot]
+        live = self.live[:n]
+        held = (self.neighbour_ids[:n] == watch_id) & live[:, None]
+        listed = held.any(axis=1)
+        weakest = self.neighbour_scores[:n, -1]
+
+        rows = np.flatnonzero(listed)
+        keep = scores[rows] >= weakest[rows]
+        updated = rows[keep]
+        self.neighbour_scores[updated, np.argmax(held[updated], axis=1)] = scores[updated]
+
+        inserted = np.flatnonzero(live & ~listed & (scores > weakest))
+        self.neighbour_ids[inserted, -1] = watch_id
+        self.neighbour_scores[inserted, -1] = scores[inserted]
+
+        resorted = np.concatenate([updated, inserted])
+        ids, scored = self.neighbour_ids[resorted], self.neighbour_scores[resorted]
+        order = np.argsort(-scored, axis=1, kind="stable")
+        self.neighbour_ids[resorted] = np.take_along_axis(ids, order, axis=1)
+        self.neighbour_scores[resorted] = np.take_along_axis(scored, order, axis=1)
+
+        self.rank(rows[~keep])
+        return np.concatenate([rows, inserted])
+
+    def listing(self, watch_id: int):
+        """Live slots whose neighbour lists contain a watch."""
+        n = self.n
+        return np.flatnonzero(self.live[:n] & (self.neighbour_ids[:n] == watch_id).any(axis=1))
+
+    def neighbour_list(self, slot: int) -> Tuple[int, ...]:
+        """Neighbour IDs of a slot, best match first."""
+        return tuple(n_id for n_id in self.neighbour_ids[slot].tolist() if n_id >= 0)
+
+    def grow(self, capacity: int):
+        """Resize every slot array to capacity."""
+        for name, fill in self._FILLS:
+            column = getattr(self, name)
+            fill = self.sentinel if fill is None else fill
+            grown = np.full((capacity,) + column.shape[1:], fill, dtype=column.dtype)
+            grown[:self.n] = column[:self.n]
+            setattr(self, name, grown)
+
+    def compact(self):
+        """Drop dead slots in place and rebuild the inverted index."""
+        keep = np.flatnonzero(self.live[:self.n])
+        for name, fill in self._FILLS:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+            column[len(keep):self.n] = self.sentinel if fill is None else fill
+        self.n = len(keep)
+        self.slots = {watch_id: slot for slot, watch_id in enumerate(self.ids[:self.n].tolist())}
+        self.index_postings()
+
+    def index_postings(self):
+        """Rebuild the inverted index from the live slots."""
+        n = self.n
+        mask = (self.terms[:n] != self.sentinel) & self.live[:n, None]
+        rows = np.nonzero(mask)[0].astype(np.int32)
+        cols = self.terms[:n][mask]
+        weights = self.weights[:n][mask]
+        order = np.argsort(cols, kind="stable")
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        bounds = np.searchsorted(cols, np.arange(self.sentinel + 1))
+        self.postings = [
+            _Postings(rows[lo:hi].copy(), weights[lo:hi].copy())
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def nbytes(self) -> int:
+        """Bytes held in slot arrays and posting lists."""
+        arrays = sum(getattr(self, name).nbytes for name, _ in self._FILLS)
+        return int(arrays + sum(p.rows.nbytes + p.weights.nbytes for p in self.postings))
+
+    def _write(self, slot: int, watch_id: int, doc, price: float):
+        """Write a watch's strongest TF-IDF terms, price and ID into a slot."""
+        weights = {}
+        for term, count in Counter(doc).items():
+            col = self.vocab.get(term)
+            if col is not None:
+                weights[col] = (1 + math.log(count)) * self.idf[col]
+        top = sorted(weights.items(), key=lambda item: item[1], reverse=True)[:MAX_TERMS_PER_WATCH]
+        norm = math.sqrt(sum(w * w for _, w in top)) or 1.0
+
+        self.terms[slot] = self.sentinel
+        self.weights[slot] = 0
+        for i, (col, weight) in enumerate(top):
+            self.terms[slot, i] = col
+            self.weights[slot, i] = weight / norm
+        self.prices[slot] = price
+        self.ids[slot] = watch_id
+        self.live[slot] = True
+        self.neighbour_ids[slot] = -1
+        self.neighbour_scores[slot] = -np.inf
+        self.slots[watch_id] = slot
+
+    def _price_proximity(self, slots):
+        """exp(-|log a - log b|) of slots against all prices, as smaller / larger price."""
+        prices = self.prices[:self.n]
+        return np.minimum(prices[slots, None], prices) / np.maximum(prices[slots, None], prices)
+
+
+class SimilarityIndex:
+    """
+    In-memory TF-IDF similarity index with precomputed top-k neighbours.
+
+    Vocabulary and IDF weights are fixed at the last full build; watches
+    written afterwards are vectorized against them, so terms first seen
+    in new watches count only after the next rebuild.
+
+    Writes made while a build runs are applied to the current index and
+    recorded, then replayed onto the new one before it is swapped in.
+
+    Args:
+        top_k: Number of neighbours precomputed per watch
+        max_features: Maximum vocabulary size (most frequent terms kept)
+    """
+
+    def __init__(self, top_k: int = SIMILAR_TOP_K, max_features: int = SIMILARITY_MAX_FEATURES):
+        self.top_k = top_k
+        self.max_features = max_features
+        # Serializes writers; lookups only read the published dictionaries
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._store = None
+        self._pending = None
+        self._neighbours: Dict[int, Tuple[int, ...]] = {}
+        self._payloads: Dict[int, bytes] = {}
+
+    @property
+    def built(self) -> bool:
+        """Whether a full build has completed."""
+        return self._store is not None
+
+    def build(self, load_watches: Callable[[], list]):
+        """
+        Rebuild vocabulary, term rows and all neighbour lists from scratch.
+
+        CPU-bound and quadratic in the catalog size; call it from a worker
+        thread, not the event loop. Lookups and writes continue against the
+        previous index meanwhile.
+
+        Args:
+            load_watches: Returns every watch in the catalog. Called after
+                write recording starts, so no committed write is missed.
+        """
+        with self._build_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                watches = load_watches()
+                docs = [tokenize(w) for w in watches]
+                df = Counter(term for doc in docs for term in set(doc))
+                terms = [term for term, _ in df.most_common(self.max_features)]
+                n = len(docs)
+                idf = np.array(
+                    [math.log((1 + n) / (1 + df[term])) + 1 for term in terms], dtype=np.float32
+                )
+                store = _RowStore({term: col for col, term in enumerate(terms)}, idf, self.top_k, n)
+                store.load(watches, docs)
+                payloads = {w.id: _serialize(w) for w in watches}
+                neighbours = {w.id: store.neighbour_list(slot) for slot, w in enumerate(watches)}
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._store = store
+                self._payloads = payloads
+                self._neighbours = neighbours
+                for watch_id, doc, price, payload in pending:
+                    if doc is None:
+                        self._remove(watch_id)
+                    else:
+                        self._upsert(watch_id, doc, price, payload)
+
+    def upsert(self, watch):
+        """
+        Add or refresh one watch and patch affected neighbour lists.
+
+        Args:
+            watch: Watch object as just committed
+        """
+        doc = tokenize(watch)
+        payload = _serialize(watch)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((watch.id, doc, watch.price, payload))
+            if self._store is not None:
+                self._upsert(watch.id, doc, watch.price, payload)
+
+    def remove(self, watch_id: int):
+        """
+        Drop one watch and re-rank watches that listed it.
+
+        Args:
+            watch_id: ID of the deleted watch
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((watch_id, None, None, None))
+            if self._store is not None:
+                self._remove(watch_id)
+
+    def similar(self, watch_id: int, limit: int):
+        """
+        Look up precomputed neighbours of a watch without locking.
+
+        Args:
+            watch_id: Watch ID
+            limit: Maximum number of neighbours to return
+
+        Returns:
+            bytes: JSON array of WatchResponse objects, best match first,
+            or None if the watch is not in the index
+        """
+        neighbour_ids = self._neighbours.get(watch_id)
+        if neighbour_ids is None:
+            return None
+        payloads = self._payloads
+        found = (payloads.get(n_id) for n_id in neighbour_ids[:limit])
+        return b"[" + b",".join(payload for payload in found if payload is not None) + b"]"
+
+    def neighbours(self, watch_id: int):
+        """
+        Precomputed neighbour IDs of a watch, best match first.
+
+        Args:
+            watch_id: Watch ID
+
+        Returns:
+            List[int]: Neighbour IDs, or None if the watch is not in the index
+        """
+        neighbour_ids = self._neighbours.get(watch_id)
+        return None if neighbour_ids is None else list(neighbour_ids)
+
+    def stats(self) -> dict:
+        """
+        Describe the index size.
+
+        Returns:
+            dict: watch count, vocabulary size and bytes held in row arrays
+            and posting lists
+        """
+        with self._lock:
+            store = self._store
+            return {
+                "watches": len(store.slots) if store else 0,
+                "vocabulary": len(store.vocab) if store else 0,
+                "matrix_bytes": store.nbytes() if store else 0,
+            }
+
+    def _upsert(self, watch_id: int, doc, price: float, payload: bytes):
+        """Score a written watch and publish the lists it changed (caller holds the lock)."""
+        store = self._store
+        store.kill(watch_id)
+        slot = store.add(watch_id, doc, price)
+        scores = store.scores(slot)
+        store.set_top(np.array([slot]), scores[None, :])
+        changed = store.offer(slot, scores)
+        self._payloads[watch_id] = payload
+        self._publish(np.append(changed, slot))
+
+    def _remove(self, watch_id: int):
+        """Drop a watch and publish re-ranked lists (caller holds the lock)."""
+        store = self._store
+        if not store.kill(watch_id):
+            return
+        self._neighbours.pop(watch_id, None)
+        stale = store.listing(watch_id)
+        store.rank(stale)
+        self._publish(stale)
+        self._payloads.pop(watch_id, None)
+
+    def _publish(self, slots):
+        """Replace the published neighbour lists of slots, one atomic assignment each."""
+        store = self._store
+        for slot in slots.tolist():
+            self._neighbours[int(store.ids[slot])] = store.neighbour_list(slot)
+
+
+def _serialize(watch) -> bytes:
+    """Pre-serialize a watch so lookups skip validation and JSON encoding."""
+    return WatchResponse.model_validate(watch).model_dump_json().encode()
+
+
+# Process-wide index used by crud and the API
+similarity_index = SimilarityIndex()
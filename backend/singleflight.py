@@ -0,0 +1,110 @@
+"""
+Request coalescing (single-flight) for read paths.
+
+When many identical requests arrive at the same time, only the first one
+(the "leader") runs the underlying query. The others wait for the leader
+and receive the same result. If the leader failed, each waiter raises its
+own SingleFlightError chained to the leader's exception, so concurrent
+waiters never share (and extend) one traceback.
+Nothing is cached: once a flight lands, the next request starts a new one.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised when a waiter gives up on an in-flight call."""
+
+
+class SingleFlightError(RuntimeError):
+    """Raised in a waiter when the leader failed; the cause is its exception."""
+
+
+class _Call:
+    """State of one in-flight call shared by its leader and waiters."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls into a single execution.
+
+    Route handlers declared with `def` run in FastAPI's threadpool,
+    so coordination uses threading primitives.
+
+    Args:
+        timeout: Maximum seconds a waiter blocks on the leader
+    """
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"executions": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers using the same key.
+
+        Args:
+            key: Identifies identical requests
+            fn: Zero-argument callable performing the real work
+
+        Returns:
+            The result of fn, shared by every caller of the flight
+
+        Raises:
+            SingleFlightTimeout: If a waiter waited longer than timeout
+            SingleFlightError: In a waiter, if the leader's fn raised
+            Exception: Whatever fn raised, in the leader
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+                leader = True
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as exc:
+                call.error = exc
+                with self._lock:
+                    self._stats["errors"] += 1
+                raise
+            finally:
+                # Land the flight before waking waiters so later arrivals
+                # start a fresh call instead of reusing a finished one.
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        elif not call.done.wait(self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+
+        if call.error is not None:
+            raise SingleFlightError(f"In-flight call {key!r} failed") from call.error
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Return counters describing coalescing activity.
+
+        Returns:
+            dict: executions, coalesced, timeouts, errors and in_flight counts
+        """
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
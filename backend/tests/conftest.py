@@ -0,0 +1,89 @@
+"""
+Shared pytest fixtures.
+
+Backend modules import each other by bare name, so the backend directory
+is put on sys.path. Each test gets a fresh SQLite file and fresh copies of
+the in-memory state that crud patches.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import schemas  # noqa: E402
+from catalog_snapshot import CatalogSnapshot  # noqa: E402
+from database import Base  # noqa: E402
+from models import Watch  # noqa: E402
+from popularity import ViewCounter  # noqa: E402
+from similarity import SimilarityIndex  # noqa: E402
+
+BRANDS = ["Rolex", "Omega", "Patek Philippe"]
+WORDS = "diver chronograph moon steel gold automatic dress bezel dial sapphire".split()
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """Sessionmaker bound to a fresh SQLite file, with fresh crud indexes."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(crud, "similarity_index", SimilarityIndex(top_k=5))
+    monkeypatch.setattr(crud, "catalog_snapshot", CatalogSnapshot())
+    monkeypatch.setattr(crud, "view_counter", ViewCounter(shards=4))
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    """Database session on the test database."""
+    session = session_factory()
+    yield session
+    session.close()
+
+
+def random_watch(rng: random.Random) -> schemas.WatchCreate:
+    """A random valid watch; prices repeat often to exercise ties."""
+    return schemas.WatchCreate(
+        name=" ".join(rng.sample(WORDS, 2)),
+        brand=rng.choice(BRANDS),
+        description=" ".join(rng.choice(WORDS) for _ in range(8)),
+        price=rng.choice([1000.0, 2500.0, 5000.0, round(rng.uniform(500, 50000), 2)]),
+        image_url="https://example.com/watch.jpg",
+        stock=rng.randint(0, 4),
+    )
+
+
+def random_update(rng: random.Random) -> schemas.WatchUpdate:
+    """A random partial update touching brand, price, stock or text."""
+    fields = {
+        "brand": rng.choice(BRANDS),
+        "price": rng.choice([1000.0, 2500.0, round(rng.uniform(500, 50000), 2)]),
+        "stock": rng.randint(0, 4),
+        "description": " ".join(rng.choice(WORDS) for _ in range(8)),
+    }
+    chosen = rng.sample(sorted(fields), rng.randint(1, len(fields)))
+    return schemas.WatchUpdate(**{field: fields[field] for field in chosen})
+
+
+def random_writes(db, rng: random.Random, steps: int):
+    """Apply a random sequence of creates, updates and deletes through crud."""
+    for _ in range(steps):
+        ids = [row[0] for row in db.query(Watch.id).all()]
+        roll = rng.random()
+        if roll < 0.45 or len(ids) < 3:
+            crud.create_watch(db, random_watch(rng))
+        elif roll < 0.8:
+            crud.update_watch(db, rng.choice(ids), random_update(rng))
+        else:
+            crud.delete_watch(db, rng.choice(ids))
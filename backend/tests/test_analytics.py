@@ -0,0 +1,74 @@
+"""Tests for incrementally maintained brand inventory aggregates."""
+
+import random
+
+import analytics
+import crud
+import schemas
+from conftest import random_watch, random_writes
+from models import BrandInventory
+
+
+def test_random_writes_keep_aggregates_consistent(db):
+    rng = random.Random(28)
+    for _ in range(10):
+        random_writes(db, rng, 30)
+        assert analytics.check_inventory(db) == []
+
+
+def test_removing_price_bounds_rescans_brand(db):
+    prices = [1000.0, 2000.0, 3000.0]
+    ids = [
+        crud.create_watch(db, random_watch(random.Random(0)).model_copy(update={"brand": "Omega", "price": p})).id
+        for p in prices
+    ]
+
+    crud.delete_watch(db, ids[0])
+    crud.update_watch(db, ids[2], schemas.WatchUpdate(price=1500.0))
+
+    row = db.get(BrandInventory, "Omega")
+    assert (row.min_price, row.max_price) == (1500.0, 2000.0)
+    assert analytics.check_inventory(db) == []
+
+
+def test_moving_last_watch_of_brand_drops_its_row(db):
+    watch = crud.create_watch(db, random_watch(random.Random(1)).model_copy(update={"brand": "Solo"}))
+
+    crud.update_watch(db, watch.id, schemas.WatchUpdate(brand="Other"))
+
+    assert db.get(BrandInventory, "Solo") is None
+    assert analytics.check_inventory(db) == []
+
+
+def test_update_from_stale_session_uses_committed_row(session_factory):
+    setup = session_factory()
+    watch_id = crud.create_watch(setup, random_watch(random.Random(2))).id
+    setup.close()
+
+    # One admin's session loads the watch, then another admin edits the price
+    stale, other = session_factory(), session_factory()
+    stale_watch = crud.get_watch(stale, watch_id)
+    crud.update_watch(other, watch_id, schemas.WatchUpdate(price=99999.0))
+
+    crud.update_watch(stale, stale_watch.id, schemas.WatchUpdate(stock=7))
+
+    assert analytics.check_inventory(stale) == []
+    stale.close()
+    other.close()
+
+
+def test_threshold_change_triggers_rebuild(db, monkeypatch):
+    rng = random.Random(7)
+    random_writes(db, rng, 40)
+    analytics.rebuild_inventory(db)
+    assert not analytics.inventory_is_stale(db)
+
+    monkeypatch.setattr(analytics, "LOW_STOCK_THRESHOLD", analytics.LOW_STOCK_THRESHOLD + 3)
+    assert analytics.inventory_is_stale(db)
+    assert analytics.check_inventory(db) != []
+
+    analytics.rebuild_inventory(db)
+    assert not analytics.inventory_is_stale(db)
+    assert analytics.check_inventory(db) == []
+    summary = analytics.get_inventory_summary(db)
+    assert summary["low_stock_threshold"] == analytics.LOW_STOCK_THRESHOLD
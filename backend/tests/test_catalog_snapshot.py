@@ -0,0 +1,102 @@
+"""Tests for the incrementally patched catalog snapshot."""
+
+import random
+
+import analytics
+import crud
+import schemas
+from catalog_snapshot import CatalogSnapshot
+from conftest import BRANDS, random_watch, random_writes
+from models import Watch
+
+QUERIES = [
+    {},
+    {"sort": "price_asc"},
+    {"sort": "price_desc", "limit": 7},
+    {"max_price": 2500.0, "sort": "price_asc"},
+    {"min_price": 1000.0, "max_price": 5000.0, "in_stock": True},
+    {"brand": "Omega", "sort": "price_desc", "skip": 2, "limit": 5},
+    {"brand": "Rolex", "in_stock": True, "skip": 1, "limit": 3},
+    {"min_price": 2500.0, "skip": 3, "limit": 4},
+    {"brand": "Unknown"},
+]
+
+
+def sql_ids(db, skip=0, limit=100, **filters):
+    """IDs returned by the SQL path for the same query."""
+    query = crud.watch_query(db, **filters).with_entities(Watch.id)
+    return [row[0] for row in query.offset(skip).limit(limit).all()]
+
+
+def assert_matches_fresh_build_and_sql(db):
+    fresh = CatalogSnapshot()
+    fresh.build(db)
+    for params in QUERIES:
+        live = crud.catalog_snapshot.query(**params)
+        assert live == fresh.query(**params), params
+        assert live == sql_ids(db, **params), params
+
+
+def test_random_writes_match_fresh_build_and_sql(db):
+    rng = random.Random(32)
+    for _ in range(10):
+        crud.create_watch(db, random_watch(rng))
+    crud.catalog_snapshot.build(db)
+
+    for _ in range(10):
+        random_writes(db, rng, 30)
+        assert_matches_fresh_build_and_sql(db)
+        assert analytics.check_inventory(db) == []
+
+
+def test_out_of_order_ids_use_overflow(db):
+    rng = random.Random(5)
+    ids = [crud.create_watch(db, random_watch(rng)).id for _ in range(12)]
+    gaps = ids[2:9:3]
+    db.query(Watch).filter(Watch.id.in_(gaps)).delete(synchronize_session=False)
+    db.commit()
+    crud.catalog_snapshot.build(db)
+
+    # IDs below the largest loaded ID land in the overflow table
+    for watch_id in gaps:
+        watch = Watch(id=watch_id, **random_watch(rng).model_dump())
+        db.add(watch)
+        db.commit()
+        crud.catalog_snapshot.upsert(watch)
+    assert sorted(crud.catalog_snapshot._overflow) == gaps
+
+    assert_matches_fresh_build_and_sql(db)
+    crud.update_watch(db, gaps[0], schemas.WatchUpdate(brand=BRANDS[1], price=2500.0))
+    crud.delete_watch(db, gaps[1])
+    assert_matches_fresh_build_and_sql(db)
+
+
+def test_reused_id_revives_deleted_slot(db):
+    rng = random.Random(6)
+    for _ in range(5):
+        crud.create_watch(db, random_watch(rng))
+    crud.catalog_snapshot.build(db)
+    last = db.query(Watch.id).order_by(Watch.id.desc()).first()[0]
+
+    crud.delete_watch(db, last)
+    assert crud.create_watch(db, random_watch(rng)).id == last
+
+    assert crud.catalog_snapshot.memory_usage()["slots"] == 5
+    assert_matches_fresh_build_and_sql(db)
+
+
+def test_get_watches_by_ids_loads_in_chunks(db, monkeypatch):
+    rng = random.Random(7)
+    ids = [crud.create_watch(db, random_watch(rng)).id for _ in range(10)]
+    wanted = ids[::-1] + [10**9]
+
+    monkeypatch.setattr(crud, "ID_CHUNK_SIZE", 3)
+    assert [w.id for w in crud.get_watches_by_ids(db, wanted)] == ids[::-1]
+
+
+def test_get_watches_by_ids_beyond_sqlite_variable_limit(db):
+    watch_id = crud.create_watch(db, random_watch(random.Random(8))).id
+
+    # One IN (...) with 300k parameters fails with "too many SQL variables"
+    wanted = list(range(watch_id + 1, watch_id + 300000)) + [watch_id]
+    assert [w.id for w in crud.get_watches_by_ids(db, wanted)] == [watch_id]
@@ -0,0 +1,87 @@
+"""Tests for write-behind view counting."""
+
+import random
+from datetime import timedelta
+
+import crud
+from conftest import random_watch
+from models import PopularityEpoch, Watch, WatchPopularity
+from popularity import POPULARITY_EPOCH, POPULARITY_HALF_LIFE_HOURS
+
+
+def test_flush_accumulates_counts_and_scores(db):
+    watch = crud.create_watch(db, random_watch(random.Random(0)))
+    for _ in range(3):
+        crud.view_counter.record(watch.id)
+    assert crud.view_counter.flush(db) == 1
+    crud.view_counter.record(watch.id)
+    assert crud.view_counter.flush(db) == 1
+
+    row = db.get(WatchPopularity, watch.id)
+    assert row.view_count == 4
+    assert row.score > 0
+    assert crud.view_counter.flush(db) == 0
+
+
+def test_flush_skips_watches_deleted_elsewhere(db):
+    rng = random.Random(1)
+    kept = crud.create_watch(db, random_watch(rng)).id
+    gone = crud.create_watch(db, random_watch(rng)).id
+    crud.view_counter.record(kept)
+    crud.view_counter.record(gone)
+
+    # Deleted by another worker, so this process's counter still holds it
+    db.query(Watch).filter(Watch.id == gone).delete()
+    db.commit()
+
+    assert crud.view_counter.flush(db) == 1
+    assert db.get(WatchPopularity, gone) is None
+    assert db.get(WatchPopularity, kept).view_count == 1
+
+
+def test_delete_discards_pending_views(db):
+    watch_id = crud.create_watch(db, random_watch(random.Random(2))).id
+    crud.view_counter.record(watch_id)
+
+    crud.delete_watch(db, watch_id)
+
+    assert crud.view_counter.drain() == {}
+
+
+def test_epoch_rolls_over_before_weights_overflow(db):
+    rng = random.Random(3)
+    old = crud.create_watch(db, random_watch(rng)).id
+    new = crud.create_watch(db, random_watch(rng)).id
+    half_life = timedelta(hours=POPULARITY_HALF_LIFE_HOURS)
+
+    for _ in range(3):
+        crud.view_counter.record(old)
+    crud.view_counter.flush(db, now=POPULARITY_EPOCH + 10 * half_life)
+    assert db.get(WatchPopularity, old).score == 3 * 2.0 ** 10
+
+    # 2 ** 2000 would overflow a float without the rollover
+    crud.view_counter.record(new)
+    crud.view_counter.flush(db, now=POPULARITY_EPOCH + 2000 * half_life)
+
+    epoch = db.get(PopularityEpoch, 1).started_at
+    assert epoch == POPULARITY_EPOCH + 2000 * half_life
+    assert db.get(WatchPopularity, new).score == 1.0
+    assert db.get(WatchPopularity, old).score == 0.0
+
+
+def test_rollover_rescales_scores_exactly(db):
+    rng = random.Random(4)
+    old = crud.create_watch(db, random_watch(rng)).id
+    new = crud.create_watch(db, random_watch(rng)).id
+    half_life = timedelta(hours=POPULARITY_HALF_LIFE_HOURS)
+
+    for _ in range(3):
+        crud.view_counter.record(old)
+    crud.view_counter.flush(db, now=POPULARITY_EPOCH + 10 * half_life)
+    crud.view_counter.record(new)
+    crud.view_counter.flush(db, now=POPULARITY_EPOCH + 100.5 * half_life)
+
+    # Moved forward by whole half-lives only, so the new weight is 2 ** 0.5
+    assert db.get(PopularityEpoch, 1).started_at == POPULARITY_EPOCH + 100 * half_life
+    assert db.get(WatchPopularity, new).score == 2.0 ** 0.5
+    assert db.get(WatchPopularity, old).score == 3 * 2.0 ** -90
@@ -0,0 +1,94 @@
+"""Tests for the sampling profiler and per-request profiles."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import profiling
+
+
+def sampled_functions(profiler):
+    """Names of all functions seen in any sample."""
+    return {name for stack in profiler.samples for name, _, _ in stack}
+
+
+def spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def profiled_handler_work():
+    spin(0.2)
+
+
+def unrelated_work(stop: threading.Event):
+    while not stop.is_set():
+        spin(0.01)
+
+
+def test_idle_asyncio_loop_is_not_sampled():
+    profiler = profiling.SamplingProfiler(0.005)
+    profiler.start()
+    asyncio.run(asyncio.sleep(0.2))
+    profiler.stop()
+
+    assert sum(profiler.samples.values()) < 0.02
+
+
+def test_idle_uvloop_loop_is_not_sampled():
+    uvloop = pytest.importorskip("uvloop")
+    profiler = profiling.SamplingProfiler(0.005)
+    profiler.start()
+    uvloop.run(asyncio.sleep(0.2))
+    profiler.stop()
+
+    assert sum(profiler.samples.values()) < 0.02
+
+
+def test_request_profile_samples_only_its_own_threads():
+    app = FastAPI()
+    app.router.route_class = profiling.ProfiledRoute
+    profiles = []
+
+    @app.middleware("http")
+    async def profile(request: Request, call_next):
+        response, profiler = await profiling.profile_request(lambda: call_next(request))
+        profiles.append(profiler)
+        return response
+
+    @app.get("/busy")
+    def busy():
+        profiled_handler_work()
+        return {}
+
+    # Another "request" keeps a second thread busy for the whole run
+    stop = threading.Event()
+    other = threading.Thread(target=unrelated_work, args=(stop,))
+    other.start()
+    try:
+        with TestClient(app) as client:
+            assert client.get("/busy").status_code == 200
+    finally:
+        stop.set()
+        other.join()
+
+    functions = sampled_functions(profiles[0])
+    assert "profiled_handler_work" in functions
+    assert "unrelated_work" not in functions
+    # The handler's thread leaves the profile when it returns
+    assert len(profiles[0].threads) == 1
+
+
+def test_library_paths_are_shortened_to_package():
+    code = type("Code", (), {
+        "co_filename": "/usr/lib/python3.11/site-packages/uvloop/__init__.py",
+        "co_name": "run",
+        "co_firstlineno": 1,
+    })
+    frame = type("Frame", (), {"f_code": code})
+    assert profiling._frame_key(frame) == ("run", "uvloop/__init__.py", 1)
@@ -0,0 +1,134 @@
+"""Tests for refresh token rotation, reuse detection and pruning."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import crud
+from auth import hash_refresh_token
+from models import RefreshToken, User
+
+
+@pytest.fixture
+def user(db):
+    db_user = User(username="alice", email="alice@example.com", hashed_password="unused")
+    db.add(db_user)
+    db.commit()
+    return db_user
+
+
+def stored(db, token):
+    db.expire_all()
+    return db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).one()
+
+
+def age_successor(db, token, seconds):
+    """Pretend the token was rotated `seconds` ago."""
+    presented = stored(db, token)
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == presented.family_id, RefreshToken.id > presented.id
+    ).update(
+        {RefreshToken.created_at: datetime.utcnow() - timedelta(seconds=seconds)},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def test_rotate_issues_new_token_and_keeps_family_expiry(db, user):
+    first = crud.create_refresh_token(db, user.id)
+
+    rotated_user, second = crud.rotate_refresh_token(db, first)
+
+    assert rotated_user.id == user.id
+    assert stored(db, first).revoked
+    assert not stored(db, second).revoked
+    assert stored(db, second).family_id == stored(db, first).family_id
+    assert stored(db, second).expires_at == stored(db, first).expires_at
+
+
+def test_expired_family_cannot_refresh(db, user):
+    token = crud.create_refresh_token(db, user.id)
+    token = crud.rotate_refresh_token(db, token)[1]
+
+    db.query(RefreshToken).update({RefreshToken.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert crud.rotate_refresh_token(db, token) is None
+
+
+def test_reuse_after_grace_window_revokes_family(db, user):
+    first = crud.create_refresh_token(db, user.id)
+    second = crud.rotate_refresh_token(db, first)[1]
+    age_successor(db, first, 3600)
+
+    assert crud.rotate_refresh_token(db, first) is None
+    assert stored(db, second).revoked
+    assert crud.rotate_refresh_token(db, second) is None
+
+
+def test_reuse_within_grace_window_issues_another_token(db, user):
+    first = crud.create_refresh_token(db, user.id)
+    second = crud.rotate_refresh_token(db, first)[1]
+
+    late_user, late = crud.rotate_refresh_token(db, first)
+
+    assert late_user.id == user.id
+    assert not stored(db, second).revoked
+    assert not stored(db, late).revoked
+    assert stored(db, late).family_id == stored(db, first).family_id
+
+
+def test_replaying_an_older_token_revokes_family(db, user):
+    first = crud.create_refresh_token(db, user.id)
+    second = crud.rotate_refresh_token(db, first)[1]
+    third = crud.rotate_refresh_token(db, second)[1]
+
+    # first's successor has been rotated again, so this is not a concurrent refresh
+    assert crud.rotate_refresh_token(db, first) is None
+    assert stored(db, third).revoked
+
+
+def test_two_concurrent_refreshes_both_succeed(session_factory, user):
+    db_a, db_b = session_factory(), session_factory()
+    try:
+        token = crud.create_refresh_token(db_a, user.id)
+        # Both requests read the token before either claims it
+        db_b.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).one()
+
+        _, from_a = crud.rotate_refresh_token(db_a, token)
+        _, from_b = crud.rotate_refresh_token(db_b, token)
+
+        assert from_a != from_b
+        assert not stored(db_a, from_a).revoked
+        assert not stored(db_a, from_b).revoked
+    finally:
+        db_a.close()
+        db_b.close()
+
+
+def test_concurrent_refresh_after_grace_window_revokes_family(session_factory, user):
+    db_a, db_b = session_factory(), session_factory()
+    try:
+        token = crud.create_refresh_token(db_a, user.id)
+        db_b.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(token)).one()
+
+        _, from_a = crud.rotate_refresh_token(db_a, token)
+        age_successor(db_a, token, 3600)
+
+        assert crud.rotate_refresh_token(db_b, token) is None
+        assert stored(db_a, from_a).revoked
+    finally:
+        db_a.close()
+        db_b.close()
+
+
+def test_delete_expired_keeps_revoked_unexpired_tokens(db, user):
+    expired = crud.create_refresh_token(db, user.id, expires_at=datetime.utcnow() - timedelta(seconds=1))
+    live = crud.create_refresh_token(db, user.id)
+    rotated = crud.create_refresh_token(db, user.id)
+    crud.rotate_refresh_token(db, rotated)
+
+    assert crud.delete_expired_refresh_tokens(db) == 1
+
+    hashes = {row.token_hash for row in db.query(RefreshToken).all()}
+    assert hash_refresh_token(expired) not in hashes
+    assert {hash_refresh_token(live), hash_refresh_token(rotated)} <= hashes
@@ -0,0 +1,90 @@
+"""Tests for the incrementally maintained similarity index."""
+
+import random
+
+import numpy as np
+
+import crud
+import schemas
+from conftest import random_watch, random_writes
+from models import Watch
+from similarity import _RowStore, tokenize
+
+
+def rebuilt_with_same_vocabulary(index, watches):
+    """Fresh full build using the vocabulary and IDF the live index was built with."""
+    store = index._store
+    fresh = _RowStore(store.vocab, store.idf, index.top_k, len(watches))
+    fresh.load(watches, [tokenize(w) for w in watches])
+    return fresh
+
+
+def assert_same_neighbours(index, fresh, watches):
+    """Live neighbours must score exactly like a fresh build's (ties may order differently)."""
+    for watch in watches:
+        slot = fresh.slots[watch.id]
+        expected = fresh.neighbour_scores[slot]
+        live_ids = index.neighbours(watch.id)
+        assert len(live_ids) == len(fresh.neighbour_list(slot))
+
+        scores = fresh.scores(slot)
+        live_scores = [scores[fresh.slots[n_id]] for n_id in live_ids]
+        assert np.allclose(live_scores, expected[:len(live_ids)], atol=1e-6)
+
+
+def test_random_writes_match_fresh_build(db):
+    rng = random.Random(29)
+    for _ in range(20):
+        crud.create_watch(db, random_watch(rng))
+    crud.similarity_index.build(lambda: db.query(Watch).all())
+
+    for _ in range(8):
+        random_writes(db, rng, 25)
+        watches = db.query(Watch).all()
+        assert crud.similarity_index.stats()["watches"] == len(watches)
+        fresh = rebuilt_with_same_vocabulary(crud.similarity_index, watches)
+        assert_same_neighbours(crud.similarity_index, fresh, watches)
+
+
+def test_row_store_grows_and_compacts(db):
+    crud.similarity_index.build(lambda: [])
+    rng = random.Random(3)
+    capacities = set()
+    for _ in range(100):
+        crud.create_watch(db, random_watch(rng))
+        capacities.add(len(crud.similarity_index._store.ids))
+    assert len(capacities) <= 4
+
+    # Updates move watches to new slots; full arrays compact instead of growing
+    ids = [row[0] for row in db.query(Watch.id).all()]
+    for _ in range(500):
+        crud.update_watch(db, rng.choice(ids), schemas.WatchUpdate(**random_watch(rng).model_dump()))
+    # 600 slots would be needed without compaction
+    assert len(crud.similarity_index._store.ids) <= 2 * max(capacities)
+    assert crud.similarity_index.stats()["watches"] == 100
+    watches = db.query(Watch).all()
+    assert_same_neighbours(
+        crud.similarity_index, rebuilt_with_same_vocabulary(crud.similarity_index, watches), watches
+    )
+
+
+def test_writes_during_build_are_replayed(db):
+    rng = random.Random(4)
+    doomed = crud.create_watch(db, random_watch(rng)).id
+    for _ in range(10):
+        crud.create_watch(db, random_watch(rng))
+
+    def load():
+        watches = db.query(Watch).all()
+        # Committed after the catalog was read, before the new index is swapped in
+        crud.delete_watch(db, doomed)
+        crud.create_watch(db, random_watch(rng))
+        return watches
+
+    crud.similarity_index.build(load)
+
+    watches = db.query(Watch).all()
+    assert crud.similarity_index.neighbours(doomed) is None
+    assert crud.similarity_index.stats()["watches"] == len(watches)
+    for watch in watches:
+        assert doomed not in crud.similarity_index.neighbours(watch.id)
@@ -0,0 +1,111 @@
+"""Tests for single-flight request coalescing."""
+
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightError, SingleFlightTimeout
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def run_flight(flight, fn, callers):
+    """Start a leader blocked in fn, then join callers - 1 waiters to it."""
+    outcomes = [None] * callers
+
+    def call(i):
+        try:
+            outcomes[i] = ("ok", flight.do("key", fn))
+        except BaseException as exc:
+            outcomes[i] = ("error", exc)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    threads[0].start()
+    wait_for(lambda: flight.stats()["in_flight"] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.stats()["coalesced"] == callers - 1)
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {"answer": 42}
+
+    threads, outcomes = run_flight(flight, fn, 8)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(outcome == ("ok", {"answer": 42}) for outcome in outcomes)
+    stats = flight.stats()
+    assert (stats["executions"], stats["coalesced"], stats["in_flight"]) == (1, 7, 0)
+
+
+def test_leader_error_fans_out_as_fresh_wrappers():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ValueError("database is gone")
+
+    def fn():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = run_flight(flight, fn, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes[0] == ("error", error)
+    wrappers = [exc for _, exc in outcomes[1:]]
+    assert all(isinstance(exc, SingleFlightError) for exc in wrappers)
+    assert all(exc.__cause__ is error for exc in wrappers)
+    assert len({id(exc) for exc in wrappers}) == len(wrappers)
+    assert flight.stats()["errors"] == 1
+
+
+def test_waiter_times_out_while_leader_keeps_running():
+    flight = SingleFlight(timeout=0.05)
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        return "late"
+
+    threads, outcomes = run_flight(flight, fn, 2)
+    threads[1].join()
+    assert outcomes[1][0] == "error"
+    assert isinstance(outcomes[1][1], SingleFlightTimeout)
+
+    release.set()
+    threads[0].join()
+    assert outcomes[0] == ("ok", "late")
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_new_flight_starts_after_one_lands():
+    flight = SingleFlight()
+    results = iter(["first", "second"])
+
+    assert flight.do("key", lambda: next(results)) == "first"
+    assert flight.do("key", lambda: next(results)) == "second"
+
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+    stats = flight.stats()
+    assert (stats["executions"], stats["coalesced"], stats["in_flight"]) == (4, 0, 0)
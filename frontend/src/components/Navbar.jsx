@@ -15,6 +15,7 @@ function Navbar() {
 
   const handleLogout = () => {
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('isAdmin');
     setIsLoggedIn(false);
     setIsAdmin(false);
@@ -1,8 +1,9 @@
 import { useState, useEffect } from 'react';
-import { watchAPI } from '../services/api';
+import { watchAPI, adminAPI } from '../services/api';
 
 function AdminDashboard() {
   const [watches, setWatches] = useState([]);
+  const [inventory, setInventory] = useState(null);
   const [loading, setLoading] = useState(true);
   const [showForm, setShowForm] = useState(false);
   const [editingWatch, setEditingWatch] = useState(null);
@@ -24,6 +25,7 @@ function AdminDashboard() {
       setLoading(true);
       const response = await watchAPI.getAllWatches();
       setWatches(response.data);
+      fetchInventory();
     } catch (err) {
       console.error('Error fetching watches:', err);
       alert('Failed to load watches');
@@ -32,6 +34,15 @@ function AdminDashboard() {
     }
   };
 
+  const fetchInventory = async () => {
+    try {
+      const response = await adminAPI.getInventoryAnalytics();
+      setInventory(response.data);
+    } catch (err) {
+      console.error('Error fetching inventory analytics:', err);
+    }
+  };
+
   const handleChange = (e) => {
     setFormData({
       ...formData,
@@ -127,6 +138,27 @@ function AdminDashboard() {
           </button>
         </div>
 
+        {inventory && (
+          <div className="grid md:grid-cols-4 gap-4 mb-8">
+            <div className="bg-[#1a1a1a] p-6 rounded-lg">
+              <div className="text-gray-400 text-sm">Watches</div>
+              <div className="text-2xl font-bold text-white">{inventory.watch_count}</div>
+            </div>
+            <div className="bg-[#1a1a1a] p-6 rounded-lg">
+              <div className="text-gray-400 text-sm">Units in Stock</div>
+              <div className="text-2xl font-bold text-white">{inventory.stock_units}</div>
+            </div>
+            <div className="bg-[#1a1a1a] p-6 rounded-lg">
+              <div className="text-gray-400 text-sm">Inventory Value</div>
+              <div className="text-2xl font-bold text-white">${inventory.stock_value.toLocaleString()}</div>
+            </div>
+            <div className="bg-[#1a1a1a] p-6 rounded-lg">
+              <div className="text-gray-400 text-sm">Low Stock (≤ {inventory.low_stock_threshold})</div>
+              <div className="text-2xl font-bold text-dark-red-light">{inventory.low_stock_count}</div>
+            </div>
+          </div>
+        )}
+
         {showForm && (
           <div className="bg-[#1a1a1a] p-8 rounded-lg mb-8">
             <h2 className="text-2xl font-bold text-white mb-6">
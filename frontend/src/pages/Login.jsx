@@ -26,6 +26,7 @@ function Login() {
     try {
       const response = await authAPI.login(formData);
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refreshToken', response.data.refresh_token);
       
       const userResponse = await authAPI.getCurrentUser();
       localStorage.setItem('isAdmin', userResponse.data.is_admin);
@@ -1,11 +1,13 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { watchAPI } from '../services/api';
+import WatchCard from '../components/WatchCard';
 
 function ProductDetail() {
   const { id } = useParams();
   const navigate = useNavigate();
   const [watch, setWatch] = useState(null);
+  const [similarWatches, setSimilarWatches] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
@@ -19,6 +21,7 @@ function ProductDetail() {
       const response = await watchAPI.getWatch(id);
       setWatch(response.data);
       setError(null);
+      fetchSimilarWatches();
     } catch (err) {
       setError('Watch not found');
       console.error('Error fetching watch:', err);
@@ -27,6 +30,16 @@ function ProductDetail() {
     }
   };
 
+  const fetchSimilarWatches = async () => {
+    try {
+      const response = await watchAPI.getSimilarWatches(id);
+      setSimilarWatches(response.data);
+    } catch (err) {
+      setSimilarWatches([]);
+      console.error('Error fetching similar watches:', err);
+    }
+  };
+
   if (loading) {
     return (
       <div className="flex justify-center items-center min-h-screen bg-black">
@@ -111,6 +124,17 @@ function ProductDetail() {
             </button>
           </div>
         </div>
+
+        {similarWatches.length > 0 && (
+          <div className="mt-16">
+            <h2 className="text-2xl font-bold text-white mb-6">You May Also Like</h2>
+            <div className="grid md:grid-cols-2 lg:grid-cols-4 gap-6">
+              {similarWatches.map((similar) => (
+                <WatchCard key={similar.id} watch={similar} />
+              ))}
+            </div>
+          </div>
+        )}
       </div>
     </div>
   );
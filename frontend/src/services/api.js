@@ -20,6 +20,38 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// On 401, swap the refresh token for a new access token once and retry,
+// so active users are not sent back to /login every 30 minutes
+let refreshPromise = null;
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (error.response?.status !== 401 || !refreshToken || original._retried || original.url === '/token/refresh') {
+      return Promise.reject(error);
+    }
+    original._retried = true;
+
+    try {
+      refreshPromise = refreshPromise || api.post('/token/refresh', { refresh_token: refreshToken });
+      const { data } = await refreshPromise;
+      localStorage.setItem('token', data.access_token);
+      localStorage.setItem('refreshToken', data.refresh_token);
+    } catch (refreshError) {
+      localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
+      return Promise.reject(error);
+    } finally {
+      refreshPromise = null;
+    }
+
+    original.headers.Authorization = `Bearer ${localStorage.getItem('token')}`;
+    return api(original);
+  }
+);
+
 export const authAPI = {
   register: (userData) => api.post('/register', userData),
   login: (credentials) => api.post('/login', new URLSearchParams(credentials), {
@@ -31,9 +63,14 @@ export const authAPI = {
 export const watchAPI = {
   getAllWatches: () => api.get('/watches'),
   getWatch: (id) => api.get(`/watches/${id}`),
+  getSimilarWatches: (id, limit = 4) => api.get(`/watches/${id}/similar`, { params: { limit } }),
   createWatch: (watchData) => api.post('/watches', watchData),
   updateWatch: (id, watchData) => api.put(`/watches/${id}`, watchData),
   deleteWatch: (id) => api.delete(`/watches/${id}`),
 };
 
+export const adminAPI = {
+  getInventoryAnalytics: () => api.get('/admin/analytics/inventory'),
+};
+
 export default api;